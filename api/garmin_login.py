@@ -1,7 +1,11 @@
 import os
+import time
+import random
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 from garminconnect import Garmin, GarminConnectAuthenticationError, GarminConnectConnectionError, GarminConnectTooManyRequestsError
+from garth.exc import GarthHTTPError
 from colorama import Fore, Style
 import json
 
@@ -17,30 +21,118 @@ PASSWORD = os.getenv("GARMIN_PASSWORD")
 TOKEN_PATH = os.path.expanduser("~/.garminconnect")
 
 
-def login_to_garmin():
-    """Authenticate and return a Garmin client instance with token persistence."""
-    
-    # Check if token file exists
-    if os.path.exists(TOKEN_PATH):
+# Refresh the OAuth2 access token this many seconds before it expires
+REFRESH_MARGIN = 300
+
+# Login attempts after a rate limit or connection error, and the base backoff in seconds
+LOGIN_RETRIES = 2
+LOGIN_BACKOFF = 30
+
+
+class GarminSession:
+    """One authenticated Garmin client per process, shared by every caller.
+
+    The client is created on first use from the stored tokens, its access
+    token is refreshed in place shortly before it expires, and email/password
+    login is only used when the stored tokens are missing or rejected.
+    """
+
+    def __init__(self, token_path=TOKEN_PATH, email=EMAIL, password=PASSWORD, refresh_margin=REFRESH_MARGIN):
+        self.token_path = token_path
+        self.email = email
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        """Return the shared client, logging in or refreshing tokens if needed."""
+        with self._lock:
+            if self._client is None:
+                self._client = self._login_with_retries()
+            else:
+                self._refresh_if_expiring()
+            return self._client
+
+    def invalidate(self):
+        """Drop the shared client so the next call logs in again."""
+        with self._lock:
+            self._client = None
+
+    def _login_with_retries(self):
+        """Log in, backing off with jitter when Garmin rate-limits or the connection drops."""
+        for attempt in range(LOGIN_RETRIES + 1):
+            try:
+                return self._login()
+            except (GarminConnectTooManyRequestsError, GarminConnectConnectionError) as e:
+                if attempt == LOGIN_RETRIES:
+                    raise
+                delay = random.uniform(0, LOGIN_BACKOFF * 2 ** attempt)
+                print(Fore.YELLOW + f"Login failed ({e}), retrying in {delay:.0f}s" + Style.RESET_ALL)
+                time.sleep(delay)
+
+    def _login(self):
+        if os.path.exists(self.token_path):
+            try:
+                client = Garmin()
+                client.login(self.token_path)
+                print(Fore.GREEN +"Logged in using stored token!" + Style.RESET_ALL)
+                return client
+            except (GarminConnectAuthenticationError, FileNotFoundError) as e:
+                # Only a rejected or incomplete token store warrants a password login
+                print(Fore.RED + f"Token login failed, re-authenticating: {e}" + Style.RESET_ALL)
+
+        return self._login_with_credentials()
+
+    def _login_with_credentials(self):
+        if not self.email or not self.password:
+            raise ValueError("Missing Garmin credentials. Set GARMIN_EMAIL and GARMIN_PASSWORD.")
+
+        print("Logging in with credentials...")
+        client = Garmin(self.email, self.password)
+        client.login()
+        client.garth.dump(self.token_path)
+        print("Garmin client created and token saved.")
+        return client
+
+    def _refresh_if_expiring(self):
+        garth_client = self._client.garth
+        token = garth_client.oauth2_token
+        if token is None or token.expires_at - time.time() > self.refresh_margin:
+            return
+
         try:
-            client = Garmin()
-            client.login(TOKEN_PATH)
-            print(Fore.GREEN +"Logged in using stored token!" + Style.RESET_ALL)
-            return client
-        except Exception as e:
-            print(Fore.RED + f"Token login failed, re-authenticating: {e}" + Style.RESET_ALL)
+            garth_client.refresh_oauth2()
+            garth_client.dump(self.token_path)
+            print(Fore.GREEN + "Refreshed Garmin access token." + Style.RESET_ALL)
+        except (GarthHTTPError, AssertionError) as e:
+            # The refresh itself was rejected, so the stored tokens are no longer usable
+            print(Fore.RED + f"Token refresh failed, re-authenticating: {e}" + Style.RESET_ALL)
+            self._client = self._login_with_credentials()
+
+
+_session = None
+_session_lock = threading.Lock()
 
-    if not EMAIL or not PASSWORD:
-        raise ValueError("Missing Garmin credentials. Set GARMIN_EMAIL and GARMIN_PASSWORD.")
 
-    print("Logging in with credentials...")
+def get_session():
+    """Return the process-wide Garmin session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = GarminSession()
+        return _session
 
+
+def get_garmin_client():
+    """Return the shared authenticated Garmin client, raising on failure."""
+    return get_session().client()
+
+
+def login_to_garmin():
+    """Authenticate and return the shared Garmin client instance, or None on failure."""
     try:
-        client = Garmin(EMAIL, PASSWORD)
-        client.login()
-        client.garth.dump(TOKEN_PATH)
-        print("Garmin client created and token saved.")
-        return client
+        return get_garmin_client()
 
     except GarminConnectAuthenticationError:
         print(Fore.RED + "Garmin authentication error. Check your credentials."+ Style.RESET_ALL)
@@ -48,6 +140,8 @@ def login_to_garmin():
         print(Fore.RED + "Garmin connection error. Check your internet connection."+ Style.RESET_ALL)
     except GarminConnectTooManyRequestsError:
         print(Fore.RED + "Too many login attempts. Try again later."+ Style.RESET_ALL)
+    except ValueError:
+        raise
     except Exception as e:
         print(Fore.RED + f"Unexpected error: {e}"+ Style.RESET_ALL)
 
@@ -0,0 +1,234 @@
+"""
+Offline stand-ins for the Garmin Connect client.
+
+- `FixtureGarmin` serves recorded (or synthetic) per-day payloads in-process
+  with the same methods we call on `Garmin`.
+- `RecordingGarmin` wraps a real client and saves every payload as a fixture.
+- `serve()` runs a local replay server and `ReplayGarmin` talks to it over
+  HTTP, so benchmarks also pay for a real network round trip.
+
+Latency, jitter and 429 responses can be injected to mimic the live API.
+
+Fixtures are stored as `<fixture_dir>/<YYYY-MM-DD>/<endpoint>.json`.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from garminconnect import GarminConnectTooManyRequestsError
+
+# Add root directory to Python path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from data_processing.retrieval.garmin_endpoints import ENDPOINTS
+
+
+def synthetic_payloads(date):
+    """Return deterministic, Garmin-shaped payloads for every endpoint of a date."""
+    rng = random.Random(date)
+    day_start = int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    minute = 60 * 1000
+
+    def series(step_minutes, low, high, end_minutes=24 * 60):
+        return [[day_start + m * minute, rng.randint(low, high)]
+                for m in range(0, end_minutes, step_minutes)]
+
+    hrv_readings = [
+        {
+            "readingTimeGMT": datetime.fromtimestamp((day_start + m * minute) / 1000, tz=timezone.utc)
+                              .strftime("%Y-%m-%dT%H:%M:%S.0"),
+            "hrvValue": rng.randint(25, 70),
+        }
+        for m in range(0, 6 * 60, 5)
+    ]
+
+    return {
+        "heart_rate": {"heartRateValues": series(2, 50, 130)},
+        "stress": {"stressValuesArray": series(3, 0, 100)},
+        "respiration": {"respirationValuesArray": series(2, 10, 22)},
+        "sleep": {"dailySleepDTO": {"sleepScores": {"overall": {"value": rng.randint(40, 95)}}}},
+        "body_battery": [{"bodyBatteryValuesArray": series(3, 5, 100)}],
+        "spo2": {"spO2HourlyAverages": series(60, 90, 100)},
+        "hrv": {"hrvSummary": {"lastNightAvg": rng.randint(30, 60)}, "hrvReadings": hrv_readings},
+    }
+
+
+class FaultInjector:
+    """Adds latency, jitter and random 429s to a call."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(-self.jitter, self.jitter)
+            throttled = self._rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return throttled
+
+
+class FixtureGarmin:
+    """Drop-in replacement for `Garmin` that serves fixtures instead of calling the API."""
+
+    def __init__(self, fixture_dir=None, synthetic=True, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.fixture_dir = fixture_dir
+        self.synthetic = synthetic
+        self.faults = FaultInjector(latency, jitter, error_rate, seed)
+        self.calls = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def payload(self, endpoint, date):
+        """Return the fixture for an endpoint and date, or None if there is none."""
+        if self.fixture_dir:
+            path = os.path.join(self.fixture_dir, date, f"{endpoint}.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    return json.load(f)
+        if self.synthetic:
+            return synthetic_payloads(date)[endpoint]
+        return None
+
+    def _call(self, endpoint, date):
+        throttled = self.faults.delay()
+        with self._lock:
+            self.calls += 1
+            self.throttled += throttled
+        if throttled:
+            raise GarminConnectTooManyRequestsError("Too many requests (injected)")
+        return self.payload(endpoint, date)
+
+    def get_heart_rates(self, date):
+        return self._call("heart_rate", date)
+
+    def get_stress_data(self, date):
+        return self._call("stress", date)
+
+    def get_respiration_data(self, date):
+        return self._call("respiration", date)
+
+    def get_sleep_data(self, date):
+        return self._call("sleep", date)
+
+    def get_body_battery(self, date):
+        return self._call("body_battery", date)
+
+    def get_spo2_data(self, date):
+        return self._call("spo2", date)
+
+    def get_hrv_data(self, date):
+        return self._call("hrv", date)
+
+
+class RecordingGarmin:
+    """Wraps a live client and saves each payload it returns as a fixture."""
+
+    def __init__(self, client, fixture_dir):
+        self.client = client
+        self.fixture_dir = fixture_dir
+
+    def __getattr__(self, name):
+        endpoints = {method: endpoint for endpoint, method in ENDPOINTS.items()}
+        if name not in endpoints:
+            return getattr(self.client, name)
+
+        def record(date):
+            payload = getattr(self.client, name)(date)
+            day_dir = os.path.join(self.fixture_dir, date)
+            os.makedirs(day_dir, exist_ok=True)
+            with open(os.path.join(day_dir, f"{endpoints[name]}.json"), "w") as f:
+                json.dump(payload, f)
+            return payload
+
+        return record
+
+
+class ReplayGarmin(FixtureGarmin):
+    """Client that fetches fixtures from a running replay server over HTTP."""
+
+    def __init__(self, base_url="http://127.0.0.1:8765"):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    def _call(self, endpoint, date):
+        with self._lock:
+            self.calls += 1
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/{endpoint}/{date}") as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                with self._lock:
+                    self.throttled += 1
+                raise GarminConnectTooManyRequestsError("Too many requests (replay server)")
+            raise
+
+
+def make_server(fixtures, host="127.0.0.1", port=8765):
+    """Create (but don't start) a threaded replay server backed by a `FixtureGarmin`."""
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] not in ENDPOINTS:
+                self.send_error(404)
+                return
+            try:
+                payload = fixtures._call(*parts)
+            except GarminConnectTooManyRequestsError:
+                self.send_error(429)
+                return
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), ReplayHandler)
+
+
+def serve(fixtures, host="127.0.0.1", port=8765):
+    """Run the replay server until interrupted."""
+    server = make_server(fixtures, host, port)
+    print(f"Replaying Garmin fixtures on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve recorded or synthetic Garmin payloads over HTTP')
+    parser.add_argument('--fixtures', type=str, default=None, help='Fixture directory (<date>/<endpoint>.json)')
+    parser.add_argument('--no-synthetic', action='store_true', help='Return empty payloads for days without fixtures')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per call in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- jitter per call in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with 429')
+    args = parser.parse_args()
+
+    if args.fixtures and not os.path.isdir(args.fixtures):
+        sys.exit(f"Fixture directory not found: {args.fixtures}")
+
+    serve(FixtureGarmin(args.fixtures, not args.no_synthetic, args.latency, args.jitter, args.error_rate),
+          port=args.port)
@@ -1,8 +1,18 @@
 import os
-import pandas as pd
-import numpy as np
+import sys
+import argparse
 from pathlib import Path
 
+# Get the root directory path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add root directory to Python path
+sys.path.append(ROOT_DIR)
+
+from data_processing.timestamps import LOCAL_FORMAT
+from data_processing.storage import DatasetStore, LABELLED_DATASET, CLEANED_DATASET
+from data_processing.schema import widen
+from data_processing.cleaning.imputer import MissingValueImputer, IMPUTER_PATH
+
 def setup_data_path():
     """Set up the data directory path."""
     DATA_DIR = os.path.join(os.getcwd(), 'data')
@@ -12,48 +22,24 @@ def setup_data_path():
 
 def load_data(DATA_DIR):
     """Load and preprocess the data."""
-    data = pd.read_csv(DATA_DIR + '/merged/labelled_data.csv')
-    # Convert timestamp to datetime, handling timezone-aware timestamps
-    data['timestamp'] = pd.to_datetime(data['timestamp'])
+    data = DatasetStore(DATA_DIR).read(LABELLED_DATASET)
+    # Timestamps come back as timezone-aware datetimes; localize any naive ones
     if data['timestamp'].dt.tz is None:
         data['timestamp'] = data['timestamp'].dt.tz_localize('UTC')
     return data
 
-def handle_missing_values(data):
-    """Handle missing values in the dataset."""
-    # Fill missing sleep scores with median, or 50 if all are missing
-    if data['sleep_score'].isna().all():
-        data['sleep_score'] = 75  # Default to middle value
-    else:
-        data['sleep_score'] = data['sleep_score'].fillna(data['sleep_score'].median())
-    
-    # Create sleep score tiers
-    data['sleep_score_tier'] = pd.cut(data['sleep_score'], 
-                                    bins=[0, 50, 70, 90, 100], 
-                                    labels=['Poor', 'Fair', 'Good', 'Excellent'])
-    
-    # Fill missing HRV values with median if all are missing in a tier
-    if data['hrv_avg'].isna().all():
-        data['hrv_avg'] = 75  # Default to middle value
-    else:
-        data['hrv_avg'] = data['hrv_avg'].fillna(data.groupby('sleep_score_tier', observed=True)['hrv_avg'].transform('mean'))
-        # Fill any remaining NaN values with overall median
-        data['hrv_avg'] = data['hrv_avg'].fillna(data['hrv_avg'].median())
+def handle_missing_values(data, imputer=None):
+    """Handle missing values in the dataset.
     
-    # Fill missing SpO2 values with median
-    data['spo2'] = data['spo2'].fillna(data['spo2'].median())
+    Missing values are filled with the statistics of a fitted
+    `MissingValueImputer`; without one, they are learned from `data` itself.
+    """
+    # Imputed values can be fractional, so fill the compact integer columns as floats
+    data = widen(data)
     
-    # Create time of day column
-    data['time_of_day'] = pd.cut(data['timestamp'].dt.hour, 
-                                bins=[0, 6, 12, 18, 22, 24], 
-                                labels=['Night', 'Morning', 'Afternoon', 'Evening', 'Night'],
-                                include_lowest=True,
-                                ordered=False)
-    
-    # Fill missing body battery values based on time of day
-    data['body_battery'] = data['body_battery'].fillna(data.groupby('time_of_day', observed=True)['body_battery'].transform('mean'))
-    # Fill any remaining NaN values with overall median
-    data['body_battery'] = data['body_battery'].fillna(data['body_battery'].median())
+    # Fill sleep score, HRV, SpO2 and body battery and add the sleep score tiers and time of day
+    imputer = imputer or MissingValueImputer().fit(data)
+    data = imputer.transform(data)
     
     # Drop any remaining missing values
     data = data.dropna()
@@ -63,24 +49,36 @@ def handle_missing_values(data):
     
     return data
 
-def save_cleaned_data(data, DATA_DIR):
-    """Save the cleaned data to a CSV file."""
-    data.to_csv(DATA_DIR + "/new/cleaned_data.csv", index=False)
+def save_cleaned_data(data, DATA_DIR, export_csv=False):
+    """Save the cleaned data, and optionally export it to a CSV file."""
+    store = DatasetStore(DATA_DIR)
+    store.write(CLEANED_DATASET, data)
+    if export_csv:
+        store.export_csv(CLEANED_DATASET, formats={'timestamp': LOCAL_FORMAT}, df=data)
     print("Cleaned data saved successfully!")
 
 def main():
     """Main function to run the data cleaning pipeline."""
+    parser = argparse.ArgumentParser(description='Clean the labelled dataset')
+    parser.add_argument('--csv', action='store_true', help='Also export data/new/cleaned_data.csv')
+    args = parser.parse_args()
+    
     # Set up data path
     DATA_DIR = setup_data_path()
     
     # Load data
     data = load_data(DATA_DIR)
     
+    # Learn the fill statistics from the labelled data and keep them for prediction
+    imputer = MissingValueImputer().fit(data)
+    imputer.save(IMPUTER_PATH)
+    print(f"Imputer saved to {IMPUTER_PATH}")
+    
     # Handle missing values
-    data = handle_missing_values(data)
+    data = handle_missing_values(data, imputer)
     
     # Save cleaned data
-    save_cleaned_data(data, DATA_DIR)
+    save_cleaned_data(data, DATA_DIR, export_csv=args.csv)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+End-to-end valence/arousal pipeline saved as one artifact per target.
+
+`EmotionFeatures` turns raw aligned rows into the model's feature matrix.
+The rows hold the Garmin metrics of a grid slot plus its lag and
+rolling-window features. The transformer fills missing values with the
+fitted `MissingValueImputer`, one-hot encodes the time of day and sleep-score
+tier from category codes, and selects the target's columns in training
+order. It works on NumPy arrays throughout: the input can be a frame, a
+`{column: array}` mapping or a 2-D array laid out as `inputs`.
+`model_selection` chains it with the fitted scaler and the tuned model, so
+prediction is a single `pipeline.predict(rows)`. Without a fitted imputer,
+missing values are filled from the rows being transformed, as cleaning does
+when no imputer was saved.
+"""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+from data_processing.schema import CATEGORIES, GARMIN_SCHEMA
+from data_processing.cleaning.imputer import (MissingValueImputer, SLEEP_TIERS, TIME_OF_DAY_CATEGORY,
+                                              ROOT_DIR)
+
+TARGETS = ["valence", "arousal"]
+
+# Metrics the imputer reads, whether or not the model uses them
+IMPUTER_INPUTS = ["sleep_score", "hrv_avg", "spo2", "body_battery"]
+
+# Prefix of the one-hot columns of each category
+DUMMY_PREFIXES = {"time_of_day": "time", "sleep_score_tier": "sleep_tier"}
+
+
+def pipeline_path(target):
+    return os.path.join(ROOT_DIR, "models", "trained", f"{target}_pipeline.joblib")
+
+
+def dummy_columns(column):
+    """`{dummy column: category}` of a categorical column."""
+    return {f"{DUMMY_PREFIXES[column]}_{label}": label for label in CATEGORIES[column].categories}
+
+
+class EmotionFeatures(BaseEstimator, TransformerMixin):
+    """Imputes, encodes and selects the model features of raw aligned rows."""
+
+    def __init__(self, columns, imputer=None):
+        self.columns = columns
+        self.imputer = imputer
+
+    @property
+    def inputs(self):
+        """Raw columns read by `transform`, in the column order of 2-D array input."""
+        dummies = {**dummy_columns("time_of_day"), **dummy_columns("sleep_score_tier")}
+        return ["hour"] + IMPUTER_INPUTS + [col for col in self.columns if col not in dummies and col not in IMPUTER_INPUTS]
+
+    def fit(self, X, y=None):
+        """Fit the imputer on a labelled frame, unless a fitted one was given."""
+        if self.imputer is None:
+            self.imputer = MissingValueImputer().fit(X)
+        return self
+
+    def transform(self, X):
+        values = self._arrays(X)
+        hours = values.pop("hour")
+        imputer = self.imputer or self._row_imputer(values, hours)
+        values, tiers, times = imputer.fill_arrays(values, hours)
+
+        # Cleaning rounds the metrics to 2 decimals before the models see them
+        for col in GARMIN_SCHEMA:
+            if col in values:
+                values[col] = np.round(values[col], 2)
+
+        # One-hot columns straight from the category codes
+        time_codes = TIME_OF_DAY_CATEGORY[times]
+        for name, label in dummy_columns("time_of_day").items():
+            values[name] = (time_codes == CATEGORIES["time_of_day"].categories.get_loc(label)).astype(np.float64)
+        for name, label in dummy_columns("sleep_score_tier").items():
+            values[name] = (tiers == SLEEP_TIERS.index(label)).astype(np.float64)
+
+        missing = [col for col in self.columns if col in GARMIN_SCHEMA and np.isnan(values[col]).any()]
+        if missing:
+            raise ValueError(f"Missing values that could not be filled in: {', '.join(missing)}")
+        # Lags into a gap have no value; the models were served 0 for them
+        return np.nan_to_num(np.column_stack([values[col] for col in self.columns]), nan=0.0)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.asarray(self.columns, dtype=object)
+
+    def __sklearn_is_fitted__(self):
+        # Without an imputer the rows themselves provide the fill statistics
+        return True
+
+    @staticmethod
+    def _row_imputer(values, hours):
+        """An imputer fitted on the rows being transformed."""
+        rows = pd.DataFrame(values)
+        rows["timestamp"] = pd.to_datetime(pd.Series(hours, dtype="int64"), unit="h")
+        return MissingValueImputer().fit(rows)
+
+    def _arrays(self, X):
+        """`{input: float array}` of a frame, mapping or 2-D array; absent metrics are missing."""
+        if isinstance(X, np.ndarray):
+            X = np.atleast_2d(X)
+            return {col: X[:, i].astype(np.float64) for i, col in enumerate(self.inputs)}
+        n = len(X["timestamp"]) if "timestamp" in X else len(X["hour"])
+        values = {}
+        for col in self.inputs:
+            if col == "hour" and "hour" not in X:
+                values[col] = pd.DatetimeIndex(X["timestamp"]).hour.to_numpy()
+            elif col in X:
+                values[col] = pd.Series(X[col]).to_numpy(dtype="float64", na_value=np.nan)
+            else:
+                values[col] = np.full(n, np.nan)
+        return values
+
+
+def build_pipeline(columns, model, scaler=None, imputer=None):
+    """Chain the feature transformer, the (optional) fitted scaler and the fitted model."""
+    steps = [("features", EmotionFeatures(columns, imputer))]
+    if scaler is not None:
+        steps.append(("scaler", scaler))
+    steps.append(("model", model))
+    return Pipeline(steps)
+
+
+def save_pipeline(pipeline, target):
+    path = pipeline_path(target)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    joblib.dump(pipeline, path)
+    return path
+
+
+def load_pipeline(target):
+    return joblib.load(pipeline_path(target))
@@ -0,0 +1,154 @@
+"""
+Missing-value imputation fitted once on the training data.
+
+`MissingValueImputer.fit` learns the fill statistics that cleaning used to
+recompute on every frame: the sleep-score median, mean HRV per sleep-score
+tier, the SpO2 median, and mean stress, respiration and body battery per
+time of day. The last three are missing wherever a reading is older than
+the alignment engine's staleness limit. The fitted
+imputer is saved next to the models, so at prediction time even a single
+row is filled with the training statistics. Tiers and times of day are
+found with `np.searchsorted` on the bin edges, so filling is a table lookup
+per value and works the same on one row or a NumPy batch.
+"""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from data_processing.schema import CATEGORIES
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+IMPUTER_PATH = os.path.join(ROOT_DIR, "models", "trained", "imputer.joblib")
+
+# Fill value when a column has no values at all in the training data
+DEFAULT_FILL = 75
+
+# Metrics filled with their mean for the row's time of day
+TIME_OF_DAY_FILLS = ["stress", "respiration", "body_battery"]
+
+# Bin edges (right-inclusive) and labels of the derived categories
+SLEEP_TIER_BINS = np.array([0, 50, 70, 90, 100])
+SLEEP_TIERS = ["Poor", "Fair", "Good", "Excellent"]
+TIME_OF_DAY_BINS = np.array([0, 6, 12, 18, 22, 24])
+TIMES_OF_DAY = ["Night", "Morning", "Afternoon", "Evening", "Night"]
+# Category code of each time-of-day bin
+TIME_OF_DAY_CATEGORY = np.array([CATEGORIES["time_of_day"].categories.get_loc(label) for label in TIMES_OF_DAY])
+
+
+def sleep_tier_codes(sleep_score):
+    """Index into SLEEP_TIERS of each score, or -1 outside the bins."""
+    codes = np.searchsorted(SLEEP_TIER_BINS, sleep_score, side="left") - 1
+    return np.where((codes >= 0) & (codes < len(SLEEP_TIERS)), codes, -1)
+
+
+def time_of_day_codes(hours):
+    """Index into TIMES_OF_DAY of each hour; midnight belongs to the first bin."""
+    codes = np.searchsorted(TIME_OF_DAY_BINS, hours, side="left") - 1
+    return np.clip(codes, 0, len(TIMES_OF_DAY) - 1)
+
+
+def group_table(values, codes, labels, fallback):
+    """Mean of `values` per label, as an array indexed by code; labels without values get `fallback`."""
+    keys = np.where(codes >= 0, np.asarray(labels, dtype=object)[np.maximum(codes, 0)], None)
+    means = pd.Series(values).groupby(keys).mean()
+    return np.array([means.get(label, fallback) for label in labels], dtype=np.float64)
+
+
+def lookup(table, codes, fallback):
+    """`table[codes]`, with `fallback` for codes outside the table or missing entries."""
+    values = np.where(codes >= 0, table[np.maximum(codes, 0)], np.nan)
+    return np.where(np.isnan(values), fallback, values)
+
+
+def fill(values, fill_values):
+    return np.where(np.isnan(values), fill_values, values)
+
+
+class MissingValueImputer:
+    """Fills missing Garmin metrics with statistics learned from training data."""
+
+    def __init__(self):
+        self.sleep_score = None
+        self.hrv_avg_by_tier = None
+        self.hrv_avg = None
+        self.spo2 = None
+        self.by_time_of_day = {}  # column: mean per time of day
+        self.time_of_day_fallback = {}  # column: median once filled by time of day
+
+    def fit(self, data):
+        """Learn the fill statistics from a labelled training frame."""
+        columns = {column: data[column].to_numpy(dtype="float64", na_value=np.nan) if column in data.columns
+                   else np.full(len(data), np.nan)
+                   for column in ["sleep_score", "hrv_avg", "spo2"] + TIME_OF_DAY_FILLS}
+        hours = data["timestamp"].dt.hour.to_numpy()
+
+        # Sleep score median, or a middle value if none are known
+        sleep_score = columns["sleep_score"]
+        self.sleep_score = DEFAULT_FILL if np.isnan(sleep_score).all() else float(np.nanmedian(sleep_score))
+        tiers = sleep_tier_codes(fill(sleep_score, self.sleep_score))
+
+        # HRV: mean per sleep-score tier, then the median of the filled column
+        hrv_avg = columns["hrv_avg"]
+        if np.isnan(hrv_avg).all():
+            self.hrv_avg_by_tier = np.full(len(SLEEP_TIERS), np.nan)
+            self.hrv_avg = DEFAULT_FILL
+        else:
+            self.hrv_avg_by_tier = group_table(hrv_avg, tiers, SLEEP_TIERS, np.nan)
+            self.hrv_avg = float(np.nanmedian(fill(hrv_avg, lookup(self.hrv_avg_by_tier, tiers, np.nan))))
+
+        self.spo2 = float(np.nanmedian(columns["spo2"])) if not np.isnan(columns["spo2"]).all() else np.nan
+
+        # Stress, respiration and body battery: mean per time of day, then the median of the filled column
+        times = time_of_day_codes(hours)
+        for column in TIME_OF_DAY_FILLS:
+            self.by_time_of_day[column] = group_table(columns[column], times, TIMES_OF_DAY, np.nan)
+            filled = fill(columns[column], lookup(self.by_time_of_day[column], times, np.nan))
+            self.time_of_day_fallback[column] = float(np.nanmedian(filled)) if not np.isnan(filled).all() else np.nan
+        return self
+
+    def fill_arrays(self, columns, hours):
+        """Fill `{column: float array}` for rows at the given local `hours`.
+
+        Works on one row or a batch; returns the filled arrays together with
+        the sleep-score tier and time-of-day codes.
+        """
+        if self.sleep_score is None:
+            raise ValueError("MissingValueImputer must be fitted before filling")
+        columns = dict(columns)
+        columns["sleep_score"] = fill(columns["sleep_score"], self.sleep_score)
+        tiers = sleep_tier_codes(columns["sleep_score"])
+        columns["hrv_avg"] = fill(columns["hrv_avg"], lookup(self.hrv_avg_by_tier, tiers, self.hrv_avg))
+        # HRV readings only exist during sleep; use the night's average outside them
+        if "hrv" in columns:
+            columns["hrv"] = fill(columns["hrv"], columns["hrv_avg"])
+        columns["spo2"] = fill(columns["spo2"], self.spo2)
+        times = time_of_day_codes(hours)
+        for column in TIME_OF_DAY_FILLS:
+            if column in columns and column in self.by_time_of_day:
+                columns[column] = fill(columns[column], lookup(self.by_time_of_day[column], times,
+                                                               self.time_of_day_fallback[column]))
+        return columns, tiers, times
+
+    def transform(self, data):
+        """Fill a frame's missing values and add the sleep-score tier and time-of-day columns."""
+        data = data.copy()
+        names = [column for column in ["sleep_score", "hrv_avg", "hrv", "spo2"] + TIME_OF_DAY_FILLS if column in data.columns]
+        columns, tiers, times = self.fill_arrays(
+            {column: data[column].to_numpy(dtype="float64", na_value=np.nan) for column in names},
+            data["timestamp"].dt.hour.to_numpy())
+        for column in names:
+            data[column] = columns[column]
+
+        data["sleep_score_tier"] = pd.Categorical.from_codes(tiers, dtype=CATEGORIES["sleep_score_tier"])
+        data["time_of_day"] = pd.Categorical.from_codes(TIME_OF_DAY_CATEGORY[times], dtype=CATEGORIES["time_of_day"])
+        return data
+
+    def save(self, path=IMPUTER_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path=IMPUTER_PATH):
+        return joblib.load(path)
@@ -0,0 +1,98 @@
+"""
+Heart-rate lag features on the 2-minute feature grid.
+
+`hr_1` and `hr_2` are the heart rate one and two grid slots back;
+`hr_change_now` and `hr_change_2min` are the deltas built from them. The
+features are computed in two ways that give the same values:
+
+- Batch: vectorised shifts of a contiguous grid array, for every slot
+  (`grid_lag_features`) or looked up by grid position (`lag_features_at`),
+  with no merge.
+- Streaming: a `LagBuffer` keeps a ring buffer of the last few slots per
+  signal. Each new sample updates it in O(1), so live features don't need
+  any history to be reloaded.
+"""
+import numpy as np
+import pandas as pd
+
+from data_processing.conversion.resample import GRID_MINUTES, grid_step, floor_to_grid, take
+
+# Grid slots back of each lag feature: 2 and 4 minutes
+LAGS = {"hr_1": 1, "hr_2": 2}
+
+
+def deltas(heart_rate, hr_1, hr_2):
+    """The heart-rate change features from the current value and its lags."""
+    return {"hr_change_now": heart_rate - hr_1, "hr_change_2min": hr_2 - hr_1}
+
+
+def shift(values, k):
+    """`values` moved `k` slots later, with NaN in the first `k`."""
+    shifted = np.full(len(values), np.nan)
+    if k < len(values):
+        shifted[k:] = values[:len(values) - k]
+    return shifted
+
+
+def grid_lag_features(heart_rate):
+    """Lag features for every slot of a contiguous heart-rate grid array."""
+    features = {name: shift(heart_rate, k) for name, k in LAGS.items()}
+    features.update(deltas(heart_rate, features["hr_1"], features["hr_2"]))
+    return features
+
+
+def lag_features_at(heart_rate, positions, current=None):
+    """Lag features of the rows at grid `positions`.
+
+    `current` is the rows' own heart rate, if it should not be taken from
+    the grid. Positions outside the grid give missing lags.
+    """
+    lags = {name: take(shift(heart_rate, k), positions) for name, k in LAGS.items()}
+    current = take(heart_rate, positions) if current is None else current
+    lags.update(deltas(current, lags["hr_1"], lags["hr_2"]))
+    return lags
+
+
+class LagBuffer:
+    """Ring buffer of the most recent grid slots of a few signals."""
+
+    def __init__(self, signals=("heart_rate",), size=max(LAGS.values()) + 1, minutes=GRID_MINUTES):
+        self.signals = list(signals)
+        self.size = size
+        self.step = grid_step(minutes)
+        self.values = np.full((len(self.signals), size), np.nan)
+        self.slot = None  # start of the newest slot, epoch ms
+
+    def push(self, ts, values):
+        """Add `{signal: value}` sampled at epoch-ms `ts`.
+
+        A sample in the newest slot replaces it; slots skipped since then are
+        cleared, so they read as gaps.
+        """
+        slot = int(floor_to_grid(ts, self.step))
+        if self.slot is not None and slot < self.slot:
+            raise ValueError("LagBuffer samples must arrive in time order")
+        if self.slot is None or slot - self.slot >= self.size * self.step:
+            self.values[:] = np.nan
+        else:
+            for skipped in range(self.slot + self.step, slot, self.step):
+                self.values[:, self._index(skipped)] = np.nan
+        self.values[:, self._index(slot)] = [np.nan if pd.isna(values.get(signal)) else values[signal]
+                                             for signal in self.signals]
+        self.slot = slot
+
+    def lag(self, signal, k):
+        """Value of `signal` `k` slots before the newest one (NaN if unknown)."""
+        if self.slot is None or k >= self.size:
+            return np.nan
+        return self.values[self.signals.index(signal), self._index(self.slot - k * self.step)]
+
+    def features(self, heart_rate=None):
+        """Lag features of the newest slot; `heart_rate` overrides its buffered value."""
+        lags = {name: self.lag("heart_rate", k) for name, k in LAGS.items()}
+        current = self.lag("heart_rate", 0) if heart_rate is None else heart_rate
+        lags.update(deltas(current, lags["hr_1"], lags["hr_2"]))
+        return lags
+
+    def _index(self, slot):
+        return (slot // self.step) % self.size
@@ -1,51 +1,223 @@
 import os
 import pandas as pd
 import numpy as np
+import sys
+import argparse
 from pathlib import Path
 
+# Get the root directory path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add root directory to Python path
+sys.path.append(ROOT_DIR)
+
+from data_processing.timestamps import localize_wall_clock, to_epoch_ms
+from data_processing.conversion.resample import grid_step, grid_positions, to_grid, take
+from data_processing.cleaning.lag_features import LAGS, LagBuffer, deltas, lag_features_at, grid_lag_features
+from data_processing.cleaning.rolling_features import ROLLING_FEATURES, RollingUpdater, feature_specs, rolling_features
+from data_processing.conversion.json_to_csv import COLUMNS, load_manifest, manifest_path
+from data_processing.storage import DatasetStore, GARMIN_DATASET, CLEANED_DATASET, VALENCE_DATASET, AROUSAL_DATASET
+from data_processing.feature_store import FeatureStore, DEFAULT_USER, feature_store_path
+
+# Derived features kept in the feature store next to the Garmin metrics
+STORED_FEATURES = list(LAGS) + ['hr_change_now', 'hr_change_2min'] + list(feature_specs())
+
+# Model inputs, in dataset column order; rolling-window features follow the physiological ones when present
+PHYSIOLOGICAL_COLUMNS = ['heart_rate', 'stress', 'respiration', 'body_battery', 'spo2', 'hrv_avg', 'sleep_score', 'hr_change_now', 'hr_change_2min']
+TIME_OF_DAY_COLUMNS = ['time_Morning', 'time_Afternoon', 'time_Evening', 'time_Night']
+
+# Columns left out of each target's dataset
+DROPPED_COLUMNS = {
+    'valence': ['timestamp', 'stress', 'hrv_avg', 'spo2', 'hr_change_2min', 'time_Afternoon'],
+    'arousal': ['timestamp', 'stress', 'body_battery', 'sleep_score', 'time_Evening', 'time_Night'],
+}
+
+def model_features(target, columns=PHYSIOLOGICAL_COLUMNS + TIME_OF_DAY_COLUMNS):
+    """The feature columns of a target's dataset, out of the available `columns`."""
+    return [col for col in columns if col not in DROPPED_COLUMNS[target]]
+
 def setup_data_path():
     """Set up the data directory path."""
     DATA_DIR = os.path.join(os.getcwd(), 'data')
     print(f"Data directory: {DATA_DIR}")
     return DATA_DIR
 
-def load_data(DATA_DIR, file_name):
+def load_cleaned_data(DATA_DIR, dataset=CLEANED_DATASET):
+    """Load the cleaned dataset; its timestamps are local wall-clock times."""
+    cleaned_data = DatasetStore(DATA_DIR).read(dataset)
+    cleaned_data['timestamp'] = localize_wall_clock(cleaned_data['timestamp'])
+    return cleaned_data
+
+def load_data(DATA_DIR, dataset=CLEANED_DATASET):
     """Load both cleaned and merged datasets."""
-    # Load cleaned data
-    cleaned_data = pd.read_csv(os.path.join(DATA_DIR, 'new', file_name))
-    cleaned_data['timestamp'] = pd.to_datetime(cleaned_data['timestamp']).dt.tz_localize(None)
-    cleaned_data['timestamp'] = cleaned_data['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    store = DatasetStore(DATA_DIR)
+    cleaned_data = load_cleaned_data(DATA_DIR, dataset)
     
-    # Load merged data for lag features
-    garmin_data = pd.read_csv(os.path.join(DATA_DIR, 'processed', 'garmin_data.csv'), parse_dates=['timestamp'])
+    # Load merged data for lag and rolling features; only their signals are needed
+    signals = sorted({'heart_rate'} | {signal for signal, _, _ in ROLLING_FEATURES})
+    garmin_data = store.read(GARMIN_DATASET, columns=['local_time'] + signals)
     
-    #make local_time column in garmin_data the timestamp column and drop the timestamp column
-    garmin_data = garmin_data.drop(columns=['timestamp'])
+    # Index garmin_data by local time
     garmin_data = garmin_data.rename(columns={'local_time': 'timestamp'})
-    garmin_data['timestamp'] = pd.to_datetime(garmin_data['timestamp']).dt.tz_localize(None)
-    garmin_data['timestamp'] = garmin_data['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
     garmin_data.set_index('timestamp', inplace=True)
     
     return cleaned_data, garmin_data
 
+def lay_out_grid(garmin_data, timestamps, columns):
+    """Lay Garmin columns out on the contiguous grid, so a slot's row is its position.
+    
+    Returns `{column: float array}` and the grid position of each timestamp.
+    """
+    grid = to_grid(garmin_data[columns].reset_index())
+    values = {column: grid[column].to_numpy(dtype='float64', na_value=np.nan) for column in columns}
+    if grid.empty:
+        return values, np.full(len(timestamps), -1)
+    return values, grid_positions(to_epoch_ms(grid['timestamp'])[0], to_epoch_ms(timestamps), grid_step())
+
 def add_lag_features(cleaned_data, garmin_data):
     """Add lag features for heart rate."""
-    # Create lag features
-    lag_features = pd.DataFrame(index=garmin_data.index)
-    lag_features['hr_1'] = garmin_data['heart_rate'].shift(1)  # 2 minutes ago
-    lag_features['hr_2'] = garmin_data['heart_rate'].shift(2)  # 4 minutes ago
-    lag_features.reset_index(inplace=True)
-    
-    # Merge lag features with cleaned data
-    data = pd.merge(
-        cleaned_data,
-        lag_features,
-        on='timestamp',
-        how='left'
-    )
-    
-    data['hr_change_now'] = data['heart_rate'] - data['hr_1']
-    data['hr_change_2min'] = data['hr_2'] - data['hr_1']
+    grid, positions = lay_out_grid(garmin_data, cleaned_data['timestamp'], ['heart_rate'])
+    
+    # Shift the grid and look the rows up by position; a lag into a gap is missing
+    data = cleaned_data.reset_index(drop=True)
+    current = data['heart_rate'].to_numpy(dtype='float64', na_value=np.nan)
+    for name, values in lag_features_at(grid['heart_rate'], positions, current).items():
+        data[name] = values
+    
+    return data
+
+def add_rolling_features(cleaned_data, garmin_data, features=ROLLING_FEATURES):
+    """Add rolling-window features (e.g. HR mean and variability over 10/30/60 minutes)."""
+    signals = sorted({signal for signal, _, _ in features})
+    grid, positions = lay_out_grid(garmin_data, cleaned_data['timestamp'], signals)
+    
+    # Compute the windows over the whole grid in one pass, then look the rows up by position
+    data = cleaned_data.reset_index(drop=True)
+    for name, values in rolling_features(grid, features).items():
+        data[name] = take(values, positions)
+    
+    return data
+
+def grid_features(garmin_data):
+    """Every stored feature for each slot of the contiguous grid of processed Garmin rows.
+    
+    These are the Garmin metrics, the gap flag, the heart-rate lags and the
+    rolling-window features.
+    """
+    grid = to_grid(garmin_data[['timestamp'] + [column for column in COLUMNS if column in garmin_data.columns]])
+    features = pd.DataFrame({'timestamp': grid['timestamp']})
+    values = {}
+    for column in COLUMNS:
+        values[column] = grid[column].to_numpy(dtype='float64', na_value=np.nan) if column in grid.columns else np.full(len(grid), np.nan)
+        features[column] = values[column]
+    features['gap'] = grid['gap'].to_numpy(dtype=bool)
+    for name, feature in {**grid_lag_features(values['heart_rate']), **rolling_features(values)}.items():
+        features[name] = feature
+    return features
+
+def update_feature_store(feature_store=None, data_store=None, user=DEFAULT_USER, dates=None):
+    """Recompute the stored features of processed days whose raw data changed.
+    
+    Days are compared with the conversion manifest. A day's first hour
+    depends on the end of the previous day, so that day is read for context
+    and the day after a changed day is recomputed as well. With `dates`,
+    only those days are considered. Returns the recomputed dates.
+    """
+    data_store = data_store or DatasetStore()
+    feature_store = feature_store or FeatureStore(feature_store_path(data_store.root))
+    manifest = load_manifest(manifest_path(data_store))
+    stored = data_store.partitions(GARMIN_DATASET)
+    sources = feature_store.sources(user)
+    
+    changed = {date for date in stored if date not in manifest or sources.get(date) != manifest[date]}
+    changed |= {stored[i + 1] for i, date in enumerate(stored[:-1]) if date in changed}
+    if dates is not None:
+        changed &= set(dates)
+    else:
+        feature_store.delete_dates(user, [date for date in sources if date not in stored])
+    
+    for i, date in enumerate(stored):
+        if date not in changed:
+            continue
+        # Read the previous day as context for the lags and rolling windows
+        partitions = dict(data_store.iter_partitions(GARMIN_DATASET, columns=['timestamp'] + COLUMNS,
+                                                     dates=stored[max(i - 1, 0):i + 1]))
+        day = partitions[date]
+        features = grid_features(pd.concat(list(partitions.values()), ignore_index=True))
+        features = features[features['timestamp'].between(day['timestamp'].min(), day['timestamp'].max())]
+        feature_store.delete_dates(user, [date])
+        feature_store.put(user, date, features)
+        feature_store.set_source(user, date, manifest.get(date, ''))
+    
+    print(f"✅ Updated stored features for {len(changed)} days")
+    return sorted(changed)
+
+def append_live_features(feature_store=None, data_store=None, user=DEFAULT_USER, dates=None):
+    """Append the newest grid slots of processed days to the feature store, one slot at a time.
+
+    For each day whose raw data changed, a `LagBuffer` and a `RollingUpdater`
+    are primed with the stored slots before the first new one, and then fed
+    the new slots. Only the new slots are computed, in O(1) each. The day's
+    newest stored slot is computed again, in case more samples arrived for
+    it. The source hashes are left alone, so `update_feature_store` still
+    recomputes these days in batch. With `dates`, only those days are
+    considered. Returns the number of slots written.
+    """
+    data_store = data_store or DatasetStore()
+    feature_store = feature_store or FeatureStore(feature_store_path(data_store.root))
+    manifest = load_manifest(manifest_path(data_store))
+    sources = feature_store.sources(user)
+    changed = [date for date in data_store.partitions(GARMIN_DATASET)
+               if (dates is None or date in dates) and (date not in manifest or sources.get(date) != manifest[date])]
+    step = grid_step()
+
+    written = 0
+    for date, day in data_store.iter_partitions(GARMIN_DATASET, columns=['timestamp'] + COLUMNS, dates=changed):
+        grid = to_grid(day)
+        slots = to_epoch_ms(grid['timestamp'])
+        last = feature_store.last_slot(user, date)
+        new = np.flatnonzero(slots >= last) if last is not None else np.arange(len(slots))
+        if len(new) == 0:
+            continue
+
+        # Prime the buffers with the stored slots their windows reach back to
+        lags, rolling = LagBuffer(), RollingUpdater()
+        first = int(slots[new[0]])
+        history = feature_store.range(user, first - max(lags.size, rolling.size) * step, first - step)
+        for ts, row in zip(to_epoch_ms(history['timestamp']), history.to_dict('records')):
+            lags.push(ts, row)
+            rolling.push(ts, row)
+
+        values = {column: grid[column].to_numpy(dtype='float64', na_value=np.nan) for column in COLUMNS}
+        gap = grid['gap'].to_numpy(dtype=bool)
+        rows = []
+        for i in new:
+            row = {column: values[column][i] for column in COLUMNS}
+            lags.push(slots[i], row)
+            rolling.push(slots[i], row)
+            rows.append({**row, 'gap': gap[i], **lags.features(), **rolling.features()})
+        features = pd.DataFrame(rows)
+        features.insert(0, 'timestamp', grid['timestamp'].iloc[new].reset_index(drop=True))
+        feature_store.put(user, date, features)
+        written += len(new)
+
+    print(f"✅ Appended {written} live feature slots")
+    return written
+
+def add_stored_features(cleaned_data, feature_store, user=DEFAULT_USER, rolling=False):
+    """Add the lag (and optionally rolling-window) features of each row's grid slot from the feature store."""
+    stored = feature_store.lookup(user, cleaned_data['timestamp'])
+    data = cleaned_data.reset_index(drop=True)
+    
+    def stored_column(name):
+        return stored[name].to_numpy(dtype='float64', na_value=np.nan) if name in stored.columns else np.full(len(data), np.nan)
+    
+    # The changes use the row's own heart rate
+    features = {name: stored_column(name) for name in LAGS}
+    features.update(deltas(data['heart_rate'].to_numpy(dtype='float64', na_value=np.nan), features['hr_1'], features['hr_2']))
+    if rolling:
+        features.update({name: stored_column(name) for name in feature_specs()})
+    for name, values in features.items():
+        data[name] = values
     
     return data
 
@@ -70,10 +242,9 @@ def encode_categorical_variables(data):
 def create_datasets(data):
     """Create separate datasets for valence and arousal."""
     # Get physiological features
-    physiological_cols = ['heart_rate', 'stress', 'respiration', 'body_battery', 'spo2', 'hrv_avg', 'sleep_score', 'hr_change_now', 'hr_change_2min']
-    dummy_cols = ['time_Morning', 'time_Afternoon', 'time_Evening', 'time_Night']
-    available_cols = [col for col in physiological_cols if col in data.columns]
-    available_cols.extend(dummy_cols)
+    available_cols = [col for col in PHYSIOLOGICAL_COLUMNS if col in data.columns]
+    available_cols.extend(col for col in feature_specs() if col in data.columns)
+    available_cols.extend(TIME_OF_DAY_COLUMNS)
     
     # Print missing values
     print("Missing values: \n", data.isnull().sum())
@@ -93,25 +264,22 @@ def create_datasets(data):
     arousal_data['arousal'] = data['arousal']
     arousal_data = arousal_data.dropna(subset=['arousal'])
     
-    # Drop specified columns for valence
-    valence_columns_to_drop = ['timestamp', 'stress','hrv_avg', 'spo2', 'hr_change_2min', 'time_Afternoon']
-    valence_data = valence_data.drop(columns=[col for col in valence_columns_to_drop if col in valence_data.columns])
-    
-    # Drop specified columns for arousal
-    arousal_columns_to_drop = ['timestamp', 'stress', 'body_battery', 'sleep_score', 'time_Evening', 'time_Night']
-    arousal_data = arousal_data.drop(columns=[col for col in arousal_columns_to_drop if col in arousal_data.columns])
+    # Keep each target's features; prediction selects the same columns
+    valence_data = valence_data[model_features('valence', available_cols) + ['valence']]
+    arousal_data = arousal_data[model_features('arousal', available_cols) + ['arousal']]
     
     return valence_data, arousal_data
 
-def save_datasets(valence_data, arousal_data, DATA_DIR):
-    """Save the processed datasets."""
-    # Create new directory if it doesn't exist
-    new_dir = os.path.join(DATA_DIR, 'new')
-    os.makedirs(new_dir, exist_ok=True)
+def save_datasets(valence_data, arousal_data, DATA_DIR, export_csv=False):
+    """Save the processed datasets, and optionally export them to CSV."""
+    store = DatasetStore(DATA_DIR)
     
     # Save datasets
-    valence_data.to_csv(os.path.join(new_dir, 'final_valence.csv'), index=False)
-    arousal_data.to_csv(os.path.join(new_dir, 'final_arousal.csv'), index=False)
+    store.write(VALENCE_DATASET, valence_data)
+    store.write(AROUSAL_DATASET, arousal_data)
+    if export_csv:
+        store.export_csv(VALENCE_DATASET, df=valence_data)
+        store.export_csv(AROUSAL_DATASET, df=arousal_data)
     
     print(f"Valence dataset shape: {valence_data.shape}")
     print(f"Arousal dataset shape: {arousal_data.shape}")
@@ -119,14 +287,29 @@ def save_datasets(valence_data, arousal_data, DATA_DIR):
 
 def main():
     """Main function to run the feature processing pipeline."""
+    parser = argparse.ArgumentParser(description='Build the final valence and arousal datasets')
+    parser.add_argument('--csv', action='store_true', help='Also export the final datasets as CSV')
+    parser.add_argument('--rolling', action='store_true', help='Add rolling-window HR, stress and body battery features')
+    parser.add_argument('--no-store', action='store_true', help='Compute the lag and rolling features from the processed data instead of the feature store')
+    args = parser.parse_args()
+    
     # Set up data path
     DATA_DIR = setup_data_path()
     
-    # Load data
-    cleaned_data, merged_data = load_data(DATA_DIR, 'cleaned_data.csv')
-    
-    # Add lag features
-    data = add_lag_features(cleaned_data, merged_data)
+    if args.no_store:
+        # Lay the processed Garmin data out on the grid and compute the features directly
+        cleaned_data, garmin_data = load_data(DATA_DIR)
+        data = add_lag_features(cleaned_data, garmin_data)
+        if args.rolling:
+            data = add_rolling_features(data, garmin_data)
+    else:
+        # Bring the feature store up to date; only days whose raw data changed are recomputed
+        cleaned_data = load_cleaned_data(DATA_DIR)
+        feature_store = FeatureStore(feature_store_path(DATA_DIR))
+        update_feature_store(feature_store, DatasetStore(DATA_DIR))
+        
+        # Add lag features, and rolling-window features if requested, from the feature store
+        data = add_stored_features(cleaned_data, feature_store, rolling=args.rolling)
     
     # Encode categorical variables
     data = encode_categorical_variables(data)
@@ -135,7 +318,7 @@ def main():
     valence_data, arousal_data = create_datasets(data)
     
     # Save datasets
-    save_datasets(valence_data, arousal_data, DATA_DIR)
+    save_datasets(valence_data, arousal_data, DATA_DIR, export_csv=args.csv)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
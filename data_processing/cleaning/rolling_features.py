@@ -0,0 +1,175 @@
+"""
+Rolling-window physiological features on the 2-minute feature grid.
+
+Each feature is a statistic of one signal over a trailing window that ends
+at (and includes) the row's slot, e.g. `hr_std_30m`. Missing slots are left
+out of the statistic, and a window with too few values gives NaN.
+
+Every statistic is built from a few window sums: the count, Σy, Σy², Σt,
+Σt², Σty, and the count and Σd² of the successive differences d.
+
+- Batch: `rolling_features` gets every window sum from one cumulative sum
+  per array, so a whole grid is O(n) regardless of the window length.
+- Live: `RollingUpdater` keeps the same sums as running totals. Each new
+  slot adds its values and subtracts the slot leaving the window.
+"""
+import numpy as np
+import pandas as pd
+
+from data_processing.conversion.resample import GRID_MINUTES, grid_step, floor_to_grid
+
+# Feature name prefix of each signal
+PREFIXES = {"heart_rate": "hr", "stress": "stress", "body_battery": "body_battery"}
+
+# (signal, statistic, window in minutes) of each feature
+ROLLING_FEATURES = [
+    ("heart_rate", "mean", 10), ("heart_rate", "std", 10), ("heart_rate", "rmssd", 10),
+    ("heart_rate", "mean", 30), ("heart_rate", "std", 30), ("heart_rate", "rmssd", 30),
+    ("heart_rate", "mean", 60), ("heart_rate", "std", 60), ("heart_rate", "rmssd", 60),
+    ("stress", "slope", 30),
+    ("body_battery", "drain", 60),
+]
+
+# Fraction of a window's slots that must have a value
+MIN_COVERAGE = 0.5
+
+SUMS = ("n", "y", "yy", "t", "tt", "ty", "dn", "dd")
+
+
+def feature_name(signal, statistic, minutes):
+    return f"{PREFIXES[signal]}_{statistic}_{minutes}m"
+
+
+def feature_specs(features=ROLLING_FEATURES):
+    """`{name: (signal, statistic, minutes)}` of the features."""
+    return {feature_name(*feature): feature for feature in features}
+
+
+def window_slots(minutes, grid_minutes=GRID_MINUTES):
+    return max(1, minutes // grid_minutes)
+
+
+def contributions(values, diffs, t):
+    """What each slot adds to the window sums; missing values add nothing."""
+    valid = ~np.isnan(values)
+    y = np.where(valid, values, 0.0)
+    t = np.where(valid, t, 0.0)
+    d_valid = ~np.isnan(diffs)
+    d = np.where(d_valid, diffs, 0.0)
+    return {"n": valid.astype(np.float64), "y": y, "yy": y * y, "t": t, "tt": t * t, "ty": t * y,
+            "dn": d_valid.astype(np.float64), "dd": d * d}
+
+
+def statistic(name, sums, slots, grid_minutes=GRID_MINUTES):
+    """A window statistic from its sums (arrays or scalars)."""
+    n = sums["n"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if name == "mean":
+            value = sums["y"] / n
+        elif name == "std":
+            value = np.sqrt(np.maximum(sums["yy"] - sums["y"] ** 2 / n, 0.0) / (n - 1))
+            value = np.where(n >= 2, value, np.nan)
+        elif name == "rmssd":
+            value = np.where(sums["dn"] > 0, np.sqrt(sums["dd"] / sums["dn"]), np.nan)
+        elif name in ("slope", "drain"):
+            # Least-squares slope per minute; drain is the fall per hour
+            value = (sums["ty"] - sums["t"] * sums["y"] / n) / (sums["tt"] - sums["t"] ** 2 / n) / grid_minutes
+            value = np.where(n >= 2, value, np.nan)
+            if name == "drain":
+                value = -60 * value
+        else:
+            raise ValueError(f"Unknown rolling statistic: {name}")
+    return np.where(n >= max(1, np.ceil(MIN_COVERAGE * slots)), value, np.nan)
+
+
+def window_sum(values, slots):
+    """Sum of each trailing window of `slots` values, from one cumulative sum."""
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    end = np.arange(1, len(values) + 1)
+    return cumulative[end] - cumulative[np.maximum(end - slots, 0)]
+
+
+def rolling_features(grid, features=ROLLING_FEATURES, grid_minutes=GRID_MINUTES):
+    """Rolling features for every slot of contiguous grid arrays `{signal: values}`."""
+    result = {}
+    prepared = {}
+    for name, (signal, stat, minutes) in feature_specs(features).items():
+        if signal not in prepared:
+            values = np.asarray(grid[signal], dtype=np.float64)
+            diffs = np.concatenate([[np.nan], np.diff(values)])
+            prepared[signal] = contributions(values, diffs, np.arange(len(values), dtype=np.float64))
+        slots = window_slots(minutes, grid_minutes)
+        parts = prepared[signal]
+        # A window of k slots holds the k - 1 differences between them
+        sums = {key: window_sum(parts[key], slots - 1 if key in ("dn", "dd") else slots) for key in SUMS}
+        result[name] = statistic(stat, sums, slots, grid_minutes)
+    return result
+
+
+class RollingUpdater:
+    """Running window sums for live rolling features, updated once per slot."""
+
+    def __init__(self, features=ROLLING_FEATURES, grid_minutes=GRID_MINUTES):
+        self.specs = feature_specs(features)
+        self.grid_minutes = grid_minutes
+        self.step = grid_step(grid_minutes)
+        self.signals = sorted({signal for signal, _, _ in self.specs.values()})
+        self.windows = sorted({window_slots(minutes, grid_minutes) for _, _, minutes in self.specs.values()})
+        self.size = max(self.windows) + 1
+        self.reset()
+
+    def reset(self):
+        self.history = {signal: np.full(self.size, np.nan) for signal in self.signals}
+        self.sums = {(signal, slots): dict.fromkeys(SUMS, 0.0) for signal in self.signals for slots in self.windows}
+        self.slot = None  # start of the newest slot, epoch ms
+        self.t = -1  # slots since the first one
+
+    def push(self, ts, values):
+        """Add `{signal: value}` sampled at epoch-ms `ts`; skipped slots count as missing."""
+        slot = int(floor_to_grid(ts, self.step))
+        if self.slot is not None and slot <= self.slot:
+            raise ValueError("RollingUpdater takes one sample per slot, in time order")
+        if self.slot is not None and slot - self.slot > self.size * self.step:
+            self.reset()
+        for _ in range(self.slot + self.step if self.slot is not None else slot, slot, self.step):
+            self._advance({})
+        self._advance(values)
+        self.slot = slot
+
+    def features(self):
+        """Rolling features of the newest slot."""
+        features = {}
+        for name, (signal, stat, minutes) in self.specs.items():
+            slots = window_slots(minutes, self.grid_minutes)
+            sums = {key: np.float64(value) for key, value in self.sums[(signal, slots)].items()}
+            features[name] = float(statistic(stat, sums, slots, self.grid_minutes))
+        return features
+
+    def _advance(self, values):
+        self.t += 1
+        for signal in self.signals:
+            history = self.history[signal]
+            value = values.get(signal)
+            history[self.t % self.size] = np.nan if pd.isna(value) else float(value)
+            entering = self._contribution(signal, self.t)
+            for slots in self.windows:
+                leaving = self._contribution(signal, self.t - slots)
+                leaving_diff = self._contribution(signal, self.t - slots + 1)
+                sums = self.sums[(signal, slots)]
+                for key in SUMS:
+                    # Differences leave the window one slot earlier than values
+                    old = leaving_diff[key] if key in ("dn", "dd") else leaving[key]
+                    sums[key] += entering[key] - old
+
+    def _contribution(self, signal, t):
+        parts = dict.fromkeys(SUMS, 0.0)
+        if t < 0 or t <= self.t - self.size:
+            return parts
+        history = self.history[signal]
+        y = history[t % self.size]
+        previous = history[(t - 1) % self.size] if t >= 1 and t - 1 > self.t - self.size else np.nan
+        if not np.isnan(y):
+            parts.update(n=1.0, y=y, yy=y * y, t=float(t), tt=float(t) * t, ty=t * y)
+        if not np.isnan(y - previous):
+            parts.update(dn=1.0, dd=(y - previous) ** 2)
+        return parts
@@ -0,0 +1,75 @@
+"""
+Alignment of Garmin signals sampled at different rates onto a common grid.
+
+Every signal is a sorted pair of int64 epoch-ms timestamps and values. Each
+grid timestamp takes the latest reading at or before it (a sorted as-of join
+with `np.searchsorted`, O(n log n)), as long as that reading is no older
+than the signal's maximum staleness. Otherwise the value is missing.
+"""
+import numpy as np
+
+from data_processing.timestamps import parse_utc
+
+MINUTE_MS = 60 * 1000
+
+# Longest a reading is carried forward, in milliseconds (None = no limit)
+MAX_STALENESS_MS = {
+    "heart_rate": 4 * MINUTE_MS,  # every 2 min
+    "stress": 10 * MINUTE_MS,  # every 3 min
+    "respiration": 10 * MINUTE_MS,  # every 2 min
+    "body_battery": 15 * MINUTE_MS,  # every 3 min, with gaps
+    "spo2": 90 * MINUTE_MS,  # hourly averages
+    "hrv": 15 * MINUTE_MS,  # every 5 min during sleep
+}
+
+
+def series_to_arrays(values):
+    """Turn `[[timestamp_ms, value], ...]` into sorted int64 timestamps and float64 values."""
+    if not values:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    arr = np.array([sample[:2] for sample in values], dtype=np.float64)
+    order = np.argsort(arr[:, 0], kind="stable")
+    return arr[order, 0].astype(np.int64), arr[order, 1]
+
+
+def readings_to_arrays(readings):
+    """Turn `{"YYYY-MM-DDTHH:MM:SS.0" (GMT): value}` readings into sorted int64 timestamps and values."""
+    if not readings:
+        return series_to_arrays(None)
+    timestamps = parse_utc(list(readings.keys())).as_unit("ms").asi8
+    values = np.array(list(readings.values()), dtype=np.float64)
+    order = np.argsort(timestamps, kind="stable")
+    return timestamps[order], values[order]
+
+
+def asof_join(grid_ts, ts, values, max_staleness=None):
+    """For each grid timestamp, take the latest value at or before it.
+
+    The value is NaN if there is none, or if it is older than `max_staleness` ms.
+    """
+    if len(ts) == 0:
+        return np.full(len(grid_ts), np.nan)
+    idx = np.searchsorted(ts, grid_ts, side="right") - 1
+    found = idx >= 0
+    if max_staleness is not None:
+        found &= grid_ts - ts[np.maximum(idx, 0)] <= max_staleness
+    return np.where(found, values[np.maximum(idx, 0)], np.nan)
+
+
+def align(grid_ts, signals, max_staleness=MAX_STALENESS_MS):
+    """Align `{name: (ts, values)}` onto `grid_ts`.
+
+    Returns `({name: aligned values}, {name: fill ratio})`, where the fill
+    ratio is the fraction of grid timestamps that received a value.
+    """
+    columns = {}
+    fill_ratios = {}
+    for name, (ts, values) in signals.items():
+        columns[name] = asof_join(grid_ts, ts, values, max_staleness.get(name))
+        fill_ratios[name] = float(np.mean(~np.isnan(columns[name]))) if len(grid_ts) else 0.0
+    return columns, fill_ratios
+
+
+def fill_ratios(df, columns):
+    """Fraction of rows with a value, per column."""
+    return {column: float(df[column].notna().mean()) if len(df) else 0.0 for column in columns}
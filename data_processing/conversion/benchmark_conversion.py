@@ -0,0 +1,125 @@
+"""
+Benchmarks `process_garmin_data` on months of synthetic raw Garmin days.
+
+Compares the vectorised conversion in `json_to_csv` against the original
+dict-per-timestamp implementation (kept below as `legacy_process_garmin_data`)
+and reports rows/sec for both, and for a process pool with `--workers`.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+from contextlib import redirect_stdout
+from datetime import date, timedelta, datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)
+
+from api.garmin_replay import synthetic_payloads
+from data_processing.retrieval.garmin_endpoints import build_day_entry
+from data_processing.conversion.json_to_csv import process_garmin_data, process_garmin_stream
+from colorama import Fore, Style
+
+
+def legacy_process_garmin_data(garmin_data):
+    """The original row-by-row conversion, kept as the benchmark baseline."""
+    processed_data = []
+
+    for date, health in garmin_data.items():
+        heart_rate_values = health.get("heart_rate", []) if health else None
+        if not heart_rate_values:
+            continue
+
+        hr_data = {
+            datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"): hr
+            for ts, hr in heart_rate_values
+        }
+
+        def extract_time_series(data, key):
+            if not data or key not in data or data[key] is None:
+                return {}
+            return {
+                datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"): value
+                for ts, value in data[key]
+            }
+
+        stress_data = extract_time_series(health.get("stress", {}), "stressValuesArray")
+        respiration_data = extract_time_series(health.get("respiration", {}), "respirationValuesArray")
+        body_battery_data = extract_time_series((health.get("body_battery") or [{}])[0], "bodyBatteryValuesArray")
+        spo2_data = extract_time_series(health.get("spo2"), "spO2HourlyAverages")
+        hrv_avg = health.get("hrv_avg", {})
+        sleep_score = health.get("sleep_score")
+
+        last_stress = last_resp = last_body_battery = last_spo2 = None
+        for timestamp, heart_rate in hr_data.items():
+            last_stress = stress_data.get(timestamp, last_stress)
+            last_resp = respiration_data.get(timestamp, last_resp)
+            last_body_battery = body_battery_data.get(timestamp, last_body_battery)
+            last_spo2 = spo2_data.get(timestamp, last_spo2)
+
+            processed_data.append({
+                "timestamp": timestamp,
+                "heart_rate": heart_rate,
+                "stress": last_stress,
+                "respiration": last_resp,
+                "body_battery": last_body_battery,
+                "spo2": last_spo2,
+                "sleep_score": sleep_score,
+                "hrv_avg": hrv_avg
+            })
+
+    return processed_data
+
+
+def synthetic_garmin_data(days, start=date(2025, 1, 1)):
+    """Build `{date: health}` for `days` consecutive synthetic days, newest first."""
+    garmin_data = {}
+    with redirect_stdout(io.StringIO()):
+        for offset in reversed(range(days)):
+            day = (start + timedelta(days=offset)).strftime("%Y-%m-%d")
+            garmin_data[day] = build_day_entry(synthetic_payloads(day))
+    return garmin_data
+
+
+def time_conversion(process, garmin_data, repeat):
+    """Best wall time of `repeat` runs of `process(garmin_data)`, with its row count."""
+    best = float("inf")
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            processed = process(garmin_data)
+            best = min(best, time.perf_counter() - start)
+    rows = len(processed["timestamp"]) if isinstance(processed, dict) else len(processed)
+    return rows, best
+
+
+def run_benchmark(days=120, repeat=3, workers=1):
+    """Convert `days` synthetic days with both implementations and return rows/sec.
+
+    With `workers` > 1 the vectorised conversion is also timed in a process pool.
+    """
+    garmin_data = synthetic_garmin_data(days)
+    implementations = [("legacy", legacy_process_garmin_data), ("vectorized", process_garmin_data)]
+    if workers > 1:
+        implementations.append((f"{workers} workers", lambda data: process_garmin_stream(data.items(), workers=workers)))
+    results = {}
+    for name, process in implementations:
+        rows, seconds = time_conversion(process, garmin_data, repeat)
+        results[name] = {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Garmin raw data conversion')
+    parser.add_argument('--days', type=int, default=120, help='Number of synthetic days to convert (default: 120)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation, best is kept (default: 3)')
+    parser.add_argument('--workers', type=int, default=1, help='Also time the conversion with this many processes')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.days, args.repeat, args.workers)
+
+    print(Fore.CYAN + "\n=== Conversion benchmark ===" + Style.RESET_ALL)
+    for name, result in results.items():
+        print(f"{name:<14}{result['rows']:>10} rows{result['seconds']:>10.3f}s{result['rows_per_sec']:>14,.0f} rows/sec")
+    print(f"Speed-up: {results['vectorized']['rows_per_sec'] / results['legacy']['rows_per_sec']:.1f}x")
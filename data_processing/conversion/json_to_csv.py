@@ -1,129 +1,325 @@
 import json
+import argparse
+import numpy as np
 import pandas as pd
 import os
-from datetime import datetime, timezone
-import pytz
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def load_garmin_data(garmin_file):
-    """Load Garmin health data from JSON file."""
-    with open(garmin_file, "r") as f:
-        garmin_data = json.load(f)
-    print("✅ Loaded Garmin health data")
-    return garmin_data
+# Get the root directory path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add root directory to Python path
+sys.path.append(ROOT_DIR)
 
-def process_garmin_data(garmin_data):
-    """Process Garmin health data into a structured format."""
-    processed_data = []
-
-    # Iterate through Garmin data (by date)
-    for date, health in garmin_data.items():
-        # Safely get heart rate values
-        heart_rate_values = health.get("heart_rate", [])
-        if not heart_rate_values:
-            continue  # Skip days with no heart rate data
-
-        # Convert heart rate timestamps to UTC
-        hr_data = {
-            datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"): hr
-            for ts, hr in heart_rate_values
-        }
-
-        # Helper function for extracting time series data
-        def extract_time_series(data, key):
-            if not data or key not in data or data[key] is None:
-                return {}
-            return {
-                datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ"): value
-                for ts, value in data[key]
-            }
-
-        # Extract all health metrics
-        stress_data = extract_time_series(health.get("stress", {}), "stressValuesArray")
-        respiration_data = extract_time_series(health.get("respiration", {}), "respirationValuesArray")
-        body_battery_data = extract_time_series(health.get("body_battery", [{}])[0], "bodyBatteryValuesArray")
-        spo2_data = extract_time_series(health.get("spo2"), "spO2HourlyAverages")
-        hrv_avg = health.get("hrv_avg", {})
-
-        # Extract HRV readings
-        hrv_data = {
-            entry["readingTimeGMT"]: entry["hrvValue"]
-            for entry in health.get("hrvReadings", [])
-        }
-
-        # Get sleep score
-        sleep_score = health.get("sleep_score")
-
-        # Initialize last known values
-        last_stress = last_resp = last_body_battery = last_spo2 = last_hrv = None
-
-        # Merge data by timestamps
-        for timestamp, heart_rate in hr_data.items():
-            # Update last known values
-            last_stress = stress_data.get(timestamp, last_stress)
-            last_resp = respiration_data.get(timestamp, last_resp)
-            last_body_battery = body_battery_data.get(timestamp, last_body_battery)
-            last_spo2 = spo2_data.get(timestamp, last_spo2)
-            last_hrv = hrv_data.get(timestamp, last_hrv)
-
-            # Store processed data
-            processed_data.append({
-                "timestamp": timestamp,
-                "heart_rate": heart_rate,
-                "stress": last_stress,
-                "respiration": last_resp,
-                "body_battery": last_body_battery,
-                "spo2": last_spo2,
-                "sleep_score": sleep_score,
-                "hrv_avg": hrv_avg
-            })
+from data_processing.retrieval.raw_format import iter_frames, RawDay
+from data_processing.retrieval.raw_store import RawStore
+from data_processing.timestamps import UTC_FORMAT, LOCAL_FORMAT, from_epoch_ms, to_local
+from data_processing.storage import DatasetStore, GARMIN_DATASET, append_csv
+from data_processing.schema import GARMIN_SCHEMA, downcast, memory_report
+from data_processing.conversion.alignment import series_to_arrays, readings_to_arrays, align, fill_ratios
+from data_processing.conversion.resample import GRID_MINUTES, grid_step, grid_range, bin_mean, scatter
+
+def iter_garmin_data(garmin_file):
+    """Yield `(date, health)` pairs from a raw Garmin file one day at a time.
+
+    Raw frame files (.bin) are streamed frame by frame; a JSON export has to
+    be parsed in one go before its days are yielded.
+    """
+    if garmin_file.endswith(".bin"):
+        yield from iter_frames(garmin_file)
+    else:
+        with open(garmin_file, "r") as f:
+            yield from json.load(f).items()
+
+# Days converted per task
+CHUNK_DAYS = 7
+
+# Part of every manifest hash; bump it when the processed output changes so all days are reconverted
+CONVERSION_VERSION = 5
+
+# Metric columns, in order, between the timestamp and the `gap` flag
+COLUMNS = ["heart_rate", "stress", "respiration", "body_battery", "spo2", "sleep_score", "hrv_avg", "hrv"]
+
+def empty_columns():
+    columns = {"timestamp": np.empty(0, dtype=np.int64)}
+    columns.update({column: np.empty(0, dtype=np.float64) for column in COLUMNS})
+    columns["gap"] = np.empty(0, dtype=bool)
+    return columns
+
+def process_garmin_day(date, health, grid_minutes=GRID_MINUTES):
+    """Process one day of Garmin health data into column arrays on the feature grid.
+
+    Timestamps stay int64 epoch milliseconds, one row per grid slot from the
+    first to the last heart-rate reading. Heart rate is averaged per slot and
+    slots without a reading are marked in `gap`. Every other metric is
+    aligned to the slots by the alignment engine: each row takes the most
+    recent reading at or before its timestamp, within the metric's maximum
+    staleness.
+    """
+    # Safely get heart rate values
+    heart_rate_values = health.get("heart_rate", []) if health else None
+    if not heart_rate_values:
+        return empty_columns()  # Skip days with no heart rate data
+
+    # Average heart rate per slot and lay it out on the day's grid
+    step = grid_step(grid_minutes)
+    slots, heart_rate = bin_mean(*series_to_arrays(heart_rate_values), step)
+    grid_ts = grid_range(slots[0], slots[-1], step)
+    heart_rate = scatter(grid_ts, slots, heart_rate, step)
+
+    # Helper function for extracting time series data
+    def extract_time_series(data, key):
+        if not data or key not in data or data[key] is None:
+            return series_to_arrays(None)
+        return series_to_arrays(data[key])
+
+    # Extract all health metrics; HRV readings are stored as {readingTimeGMT: value}
+    body_battery = health.get("body_battery") or [{}]
+    signals = {
+        "stress": extract_time_series(health.get("stress"), "stressValuesArray"),
+        "respiration": extract_time_series(health.get("respiration"), "respirationValuesArray"),
+        "body_battery": extract_time_series(body_battery[0], "bodyBatteryValuesArray"),
+        "spo2": extract_time_series(health.get("spo2"), "spO2HourlyAverages"),
+        "hrv": readings_to_arrays(health.get("hrv")),
+    }
+
+    # Daily values are repeated on every row
+    def daily_value(key):
+        value = health.get(key)
+        return np.full(len(grid_ts), np.nan if value is None else value, dtype=np.float64)
+
+    columns, _ = align(grid_ts, signals)
+    columns["timestamp"] = grid_ts
+    columns["heart_rate"] = heart_rate
+    columns["sleep_score"] = daily_value("sleep_score")
+    columns["hrv_avg"] = daily_value("hrv_avg")
+    columns["gap"] = np.isnan(heart_rate)
+
+    return {column: columns[column] for column in ["timestamp"] + COLUMNS + ["gap"]}
+
+def concat_days(days):
+    """Concatenate per-day column arrays, in order."""
+    days = [day for day in days if len(day["timestamp"])] or [empty_columns()]
+    return {column: np.concatenate([day[column] for day in days]) for column in ["timestamp"] + COLUMNS + ["gap"]}
+
+def process_garmin_chunk(chunk):
+    """Process a chunk of days into `[(date, columns), ...]`.
+
+    Days are `(date, health)` pairs or `RawDay`s read from the raw store.
+    """
+    days = []
+    for item in chunk:
+        date, health = item.decode() if isinstance(item, RawDay) else item
+        days.append((date, process_garmin_day(date, health)))
+    return days
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_parallel(chunks, workers):
+    """Process chunks in a process pool and yield the results in input order.
+
+    Only a few chunks per worker are in flight, so the raw data is still
+    read as it is consumed.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(process_garmin_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_processed_days(garmin_stream, workers=1, chunk_days=CHUNK_DAYS):
+    """Yield `(date, columns)` for each day of `(date, health)` pairs, in input order.
+
+    With `workers` > 1, chunks of days are converted in a process pool.
+    Passing `RawDay`s instead of pairs lets the workers decode
+    them as well.
+    """
+    chunks = iter_chunks(garmin_stream, chunk_days)
+    if workers > 1:
+        processed = iter_parallel(chunks, workers)
+    else:
+        processed = (process_garmin_chunk(chunk) for chunk in chunks)
+    for days in processed:
+        yield from days
+
+def process_garmin_stream(garmin_stream, workers=1, chunk_days=CHUNK_DAYS):
+    """Process `(date, health)` pairs as they arrive, holding only a few raw days at a time."""
+    days = iter_processed_days(garmin_stream, workers, chunk_days)
+    processed_data = concat_days([columns for _, columns in days])
 
     print("✅ Processed Garmin health data")
     return processed_data
 
-def create_dataframe(processed_data):
-    """Create and process DataFrame from processed data."""
-    df = pd.DataFrame(processed_data)
+def process_garmin_data(garmin_data):
+    """Process Garmin health data into a structured format (a dict of column arrays)."""
+    return process_garmin_stream(garmin_data.items())
+
+def create_dataframe(processed_data, diagnostics=False):
+    """Create and process DataFrame from processed data.
+
+    With `diagnostics`, the shape, summary statistics, missing values and
+    memory per column are printed as well; this is off on the prediction path.
+    """
+    raw_df = pd.DataFrame(processed_data)
+
+    # Canonical UTC timestamps plus a local time column (vectorised tz conversion)
+    raw_df['timestamp'] = from_epoch_ms(raw_df['timestamp'])
+    raw_df['local_time'] = to_local(raw_df['timestamp'])
+
+    # Compact fixed dtypes for the metrics, the same for every day
+    df = downcast(raw_df, GARMIN_SCHEMA)
 
-    # Add local time column
-    df['local_time'] = df['timestamp'].apply(lambda x: 
-        datetime.strptime(x, "%Y-%m-%d %H:%M:%SZ")
-        .replace(tzinfo=timezone.utc)
-        .astimezone(pytz.timezone('Europe/Madrid')) 
-        .strftime("%Y-%m-%d %H:%M:%S")
-    )
+    if diagnostics:
+        print_diagnostics(df)
+        memory_report(raw_df, df)
 
-    # Print dataset info
+    return df
+
+def print_diagnostics(df):
+    """Print dataset info."""
     print("\nDataset shape:", df.shape)
     print("\nSummary statistics:")
     print(df.describe())
     print("\nMissing values:")
     print(df.isnull().sum())
+    print("\nFill ratio per metric:")
+    for column, ratio in fill_ratios(df, COLUMNS).items():
+        print(f"{column:<14}{ratio:>8.1%}")
 
-    return df
+def append_garmin_days(garmin_stream, data_store, workers=1, chunk_days=CHUNK_DAYS, csv_path=None):
+    """Convert a stream of raw days and append each one to the processed dataset as it is done.
+
+    Each day is written as its own partition (and appended to `csv_path`, if
+    given) as soon as its chunk is converted, so downstream stages can read
+    the first days while later ones are still converting and memory stays
+    flat however long the history is. Yields `(date, rows)` per written day.
+    """
+    for date, columns in iter_processed_days(garmin_stream, workers, chunk_days):
+        if not len(columns["timestamp"]):
+            data_store.delete_partitions(GARMIN_DATASET, [date])
+            yield date, 0
+            continue
+        df = create_dataframe(columns)
+        data_store.write_partition(GARMIN_DATASET, date, df)
+        if csv_path:
+            append_csv(csv_path, df, {'timestamp': UTC_FORMAT, 'local_time': LOCAL_FORMAT})
+        yield date, len(df)
+
+def convert_file(garmin_file, data_store=None, workers=1, csv_path=None):
+    """Convert a raw Garmin file (.bin or JSON export) into the processed dataset, day by day."""
+    data_store = data_store or DatasetStore()
+    if csv_path and os.path.exists(csv_path):
+        os.remove(csv_path)
+    rows = sum(count for _, count in append_garmin_days(iter_garmin_data(garmin_file), data_store, workers, csv_path=csv_path))
+    print(f"✅ Converted {rows} rows from {garmin_file}")
+    return rows
+
+def manifest_path(data_store):
+    """Manifest of the raw content hash each processed day was converted from."""
+    return os.path.join(data_store.root, GARMIN_DATASET + "_manifest.json")
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    # Write to a temporary file first so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def convert_incremental(raw_store=None, data_store=None, dates=None, workers=1, force=False):
+    """Convert only the raw days that are new or changed since the last run.
+
+    Each raw day is hashed and compared with the manifest; changed days are
+    converted and upserted as their own partition of the processed dataset.
+    On a full run (`dates` is None), days no longer in the raw store are
+    removed as well. `force` reconverts the given `dates` (or every day)
+    whatever their hash. Returns the converted dates.
+    """
+    raw_store = raw_store or RawStore()
+    data_store = data_store or DatasetStore()
+    path = manifest_path(data_store)
+    manifest = load_manifest(path)
+    if force:
+        # Only forget the hashes of the days being forced, so the others stay up to date
+        manifest = {} if dates is None else {date: value for date, value in manifest.items() if date not in dates}
+
+    if not manifest and dates is None:
+        # Rebuilding from scratch: drop partitions written without a manifest
+        data_store.delete_partitions(GARMIN_DATASET, data_store.partitions(GARMIN_DATASET))
+
+    stored_dates = raw_store.dates()
+    if dates is not None:
+        wanted = set(dates)
+        stored_dates = [date for date in stored_dates if date in wanted]
+    hashes = {date: f"v{CONVERSION_VERSION}:{raw_store.content_hash(date)}" for date in stored_dates}
+    changed = [date for date in stored_dates if manifest.get(date) != hashes[date]]
+
+    if dates is None:
+        removed = [date for date in manifest if date not in hashes]
+        data_store.delete_partitions(GARMIN_DATASET, removed)
+        for date in removed:
+            del manifest[date]
+
+    stream = (raw_store.read_raw_day(date) for date in changed)
+    for date, _ in append_garmin_days(stream, data_store, workers):
+        manifest[date] = hashes[date]
+    save_manifest(path, manifest)
+
+    print(f"✅ Converted {len(changed)} of {len(stored_dates)} Garmin days")
+    return changed
 
 def main():
-    # Get the root directory path
-    ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    # Add root directory to Python path
-    sys.path.append(ROOT_DIR)
+    parser = argparse.ArgumentParser(description='Convert raw Garmin health data to the processed dataset')
+    parser.add_argument('--diagnostics', action='store_true', help='Print summary statistics and missing values')
+    parser.add_argument('--csv', action='store_true', help='Also export data/processed/garmin_data.csv')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes converting days (default: 1, serial)')
+    parser.add_argument('--force', action='store_true', help='Re-convert every raw day, even if unchanged')
+    parser.add_argument('--input', help='Convert a raw Garmin file (.bin or .json) instead of the raw store')
+    args = parser.parse_args()
 
     # Set working directory to root
     os.chdir(ROOT_DIR)
 
     # Define file paths
     DATA_DIR = "data/"
-    garmin_file = os.path.join(DATA_DIR, "raw/garmin_health_data.json")
     csv_filename = os.path.join(DATA_DIR, "processed/garmin_data.csv")
 
-    # Process data
-    garmin_data = load_garmin_data(garmin_file)
-    processed_data = process_garmin_data(garmin_data)
-    df = create_dataframe(processed_data)
+    store = DatasetStore(DATA_DIR)
+    if args.input:
+        # Stream the file's days into the store, appending each day to the CSV as well
+        convert_file(args.input, store, workers=args.workers, csv_path=csv_filename if args.csv else None)
+    else:
+        # Convert only the raw days that changed, one partition per day
+        convert_incremental(RawStore(), store, workers=args.workers, force=args.force)
+    print(f"✅ Garmin health data saved to {os.path.join(DATA_DIR, GARMIN_DATASET)}/")
+
+    if args.diagnostics:
+        print_diagnostics(store.read(GARMIN_DATASET))
 
-    # Save to CSV
-    df.to_csv(csv_filename, index=False)
-    print(f"✅ Garmin health data saved to {csv_filename}")
+    # Export to CSV one day at a time, formatting timestamps only now
+    if args.csv and not args.input:
+        store.export_csv(GARMIN_DATASET, csv_filename, {'timestamp': UTC_FORMAT, 'local_time': LOCAL_FORMAT})
+    if args.csv:
+        print(f"✅ Garmin health data exported to {csv_filename}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
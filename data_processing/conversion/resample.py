@@ -0,0 +1,109 @@
+"""
+The canonical feature grid: fixed slots of `GRID_MINUTES`, anchored at the epoch.
+
+Every processed day is resampled onto this grid. Readings that fall in the
+same slot are averaged (vectorised with `np.bincount`), and slots without a
+reading are kept and marked as gaps. Because the grid is regular, a
+timestamp's row is found by arithmetic, `(ts - first slot) // step`, so
+merges and lag features index into the grid by position instead of joining
+on timestamps. Slots are whole minutes, so they line up in UTC and in local
+time alike.
+"""
+import numpy as np
+import pandas as pd
+
+from data_processing.timestamps import from_epoch_ms, to_epoch_ms
+
+MINUTE_MS = 60 * 1000
+
+# Width of a grid slot; Garmin heart rate is sampled every 2 minutes
+GRID_MINUTES = 2
+
+
+def grid_step(minutes=GRID_MINUTES):
+    """Slot width in milliseconds."""
+    return minutes * MINUTE_MS
+
+
+def floor_to_grid(ts, step):
+    """Start of the slot each epoch-ms timestamp falls in."""
+    return ts - ts % step
+
+
+def grid_range(first, last, step):
+    """Every slot from `first` to `last`, inclusive."""
+    return np.arange(first, last + step, step, dtype=np.int64)
+
+
+def grid_positions(grid_start, ts, step):
+    """Row of each timestamp in a grid starting at `grid_start`."""
+    return (ts - grid_start) // step
+
+
+def bin_mean(ts, values, step):
+    """Average the readings in each slot.
+
+    Returns the sorted slots that have readings and their means (NaN if a
+    slot only has missing readings).
+    """
+    slots, inverse = np.unique(floor_to_grid(ts, step), return_inverse=True)
+    valid = ~np.isnan(values)
+    sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=len(slots))
+    counts = np.bincount(inverse, weights=valid, minlength=len(slots))
+    means = np.divide(sums, counts, out=np.full(len(slots), np.nan), where=counts > 0)
+    return slots, means
+
+
+def scatter(grid_ts, slots, values, step):
+    """Place `values` of `slots` on the grid; other slots are NaN."""
+    out = np.full(len(grid_ts), np.nan)
+    if len(grid_ts):
+        out[grid_positions(grid_ts[0], slots, step)] = values
+    return out
+
+
+def take(values, positions):
+    """`values[positions]`, with NaN where a position is outside the grid."""
+    inside = (positions >= 0) & (positions < len(values))
+    out = np.full(len(positions), np.nan)
+    out[inside] = values[positions[inside]]
+    return out
+
+
+def take_rows(grid, positions):
+    """Rows of a grid frame at `positions`; rows outside the grid are missing and marked as gaps."""
+    inside = (positions >= 0) & (positions < len(grid))
+    rows = grid.drop(columns=["gap"]).reindex(np.where(inside, positions, -1)).reset_index(drop=True)
+    gap = np.ones(len(positions), dtype=bool)
+    gap[inside] = grid["gap"].to_numpy(dtype=bool)[positions[inside]]
+    rows["gap"] = gap
+    return rows
+
+
+def to_grid(df, column="timestamp", minutes=GRID_MINUTES):
+    """Reindex a frame onto the contiguous grid from its first to its last slot.
+
+    Each row goes to the slot of its `column` timestamp (the last row wins
+    if several share a slot) and the timestamp becomes the slot start.
+    Empty slots are added as rows with missing values and `gap` set. The
+    result has one row per slot, so its index is the grid position.
+    """
+    step = grid_step(minutes)
+    df = df.reset_index(drop=True)
+    if "gap" not in df.columns:
+        df["gap"] = False
+    if df.empty:
+        return df
+
+    slots = floor_to_grid(to_epoch_ms(df[column]), step)
+    order = np.argsort(slots, kind="stable")
+    slots = slots[order]
+    last = np.append(slots[1:] != slots[:-1], True)
+
+    grid_ts = grid_range(slots[0], slots[-1], step)
+    rows = np.full(len(grid_ts), -1, dtype=np.int64)
+    rows[grid_positions(grid_ts[0], slots[last], step)] = order[last]
+
+    grid = take_rows(df, rows)
+    grid[column] = pd.Series(from_epoch_ms(grid_ts)).dt.tz_convert(df[column].dt.tz)
+    return grid
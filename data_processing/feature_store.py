@@ -0,0 +1,212 @@
+"""
+Feature store shared by training and inference.
+
+Computed feature rows are kept in a local SQLite database, keyed by
+(user, grid slot). A slot is the epoch-ms start of a 2-minute grid slot,
+and each row holds its features as JSON. Every row also records the raw
+date (processed partition) it was computed from. The hash of that
+partition's raw data is stored per date, so only changed days are
+recomputed.
+
+- Point lookups and range scans go through the `(user, ts)` primary key.
+- Recently read and written slots are kept in an in-memory LRU cache, so
+  point reads and ranges that fit in it only query the slots it lacks.
+  Slots known to be empty are cached too.
+- The database records the feature schema version; opening it with a
+  different version drops the stored rows so they get recomputed.
+"""
+import os
+import json
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_processing.storage import DATA_DIR
+from data_processing.timestamps import from_epoch_ms, to_epoch_ms
+from data_processing.conversion.resample import grid_step, floor_to_grid
+
+def feature_store_path(data_dir=DATA_DIR):
+    return os.path.join(data_dir, "features", "features.sqlite")
+
+
+FEATURE_STORE_PATH = feature_store_path()
+
+# Bump when the stored features change, so every row is recomputed
+FEATURE_SCHEMA_VERSION = 1
+
+DEFAULT_USER = "default"
+
+# Rows kept in memory
+CACHE_SIZE = 4096
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS features (
+    user TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS features_date ON features (user, date);
+CREATE TABLE IF NOT EXISTS sources (
+    user TEXT NOT NULL,
+    date TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (user, date)
+) WITHOUT ROWID;
+"""
+
+
+def encode_rows(df):
+    """One JSON object per row; missing features become null, since JSON has no NaN."""
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    return [json.dumps(record) for record in records]
+
+
+def decode_row(data):
+    return {key: np.nan if value is None else value for key, value in json.loads(data).items()}
+
+
+class FeatureStore:
+    """Feature rows keyed by (user, grid slot), with an LRU cache in front."""
+
+    def __init__(self, path=FEATURE_STORE_PATH, version=FEATURE_SCHEMA_VERSION, cache_size=CACHE_SIZE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.version = version
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self._check_version()
+
+    def get(self, user, timestamp):
+        """Features of the grid slot of a timestamp (tz-aware or epoch ms), or None if not stored."""
+        key = (user, self._to_ms(timestamp))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        row = self.connection.execute("SELECT data FROM features WHERE user = ? AND ts = ?", key).fetchone()
+        values = None if row is None else decode_row(row[0])
+        self._remember(key, values)
+        return values
+
+    def range(self, user, start, end):
+        """Rows with `start <= slot <= end` as a frame with a UTC `timestamp` column, in time order.
+
+        A range that fits in the cache is read through it; wider scans go
+        straight to the database.
+        """
+        start, end = self._to_ms(start), self._to_ms(end)
+        step = grid_step()
+        if end < start:
+            return self._frame([], [])
+        if (end - start) // step + 1 > self.cache_size:
+            rows = self.connection.execute(
+                "SELECT ts, data FROM features WHERE user = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (user, start, end)).fetchall()
+            return self._frame([ts for ts, _ in rows], [decode_row(data) for _, data in rows])
+
+        slots = list(range(start, end + step, step))
+        missing = []
+        for slot in slots:
+            if (user, slot) in self.cache:
+                self.cache.move_to_end((user, slot))
+            else:
+                missing.append(slot)
+        if missing:
+            stored = dict(self.connection.execute(
+                "SELECT ts, data FROM features WHERE user = ? AND ts BETWEEN ? AND ?",
+                (user, missing[0], missing[-1])).fetchall())
+            for slot in missing:
+                self._remember((user, slot), decode_row(stored[slot]) if slot in stored else None)
+        found = [slot for slot in slots if self.cache[(user, slot)] is not None]
+        return self._frame(found, [self.cache[(user, slot)] for slot in found])
+
+    def lookup(self, user, timestamps):
+        """Rows of the grid slots of `timestamps`, in the same order; slots not stored are missing."""
+        ts = self._to_ms(timestamps)
+        if len(ts) == 0:
+            return self._frame([], [])
+        stored = self.range(user, int(ts.min()), int(ts.max()))
+        stored.index = to_epoch_ms(stored['timestamp']) if len(stored) else pd.Index([], dtype="int64")
+        rows = stored.drop(columns=['timestamp']).reindex(ts).reset_index(drop=True)
+        rows.insert(0, 'timestamp', from_epoch_ms(ts))
+        return rows
+
+    def put(self, user, date, df):
+        """Store the rows of `df` (a `timestamp` column of slot starts plus features) computed from `date`."""
+        ts = to_epoch_ms(df['timestamp'])
+        rows = encode_rows(df.drop(columns=['timestamp']).reset_index(drop=True))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO features (user, ts, date, data) VALUES (?, ?, ?, ?)",
+                [(user, int(slot), date, data) for slot, data in zip(ts, rows)])
+        # Cached copies of replaced rows are stale; the newest rows are the likeliest to be read next
+        keys = [(user, int(slot)) for slot in ts]
+        for key in keys:
+            self.cache.pop(key, None)
+        for key, data in list(zip(keys, rows))[-self.cache_size:]:
+            self._remember(key, decode_row(data))
+
+    def last_slot(self, user, date):
+        """Epoch-ms start of the newest stored slot computed from `date`, or None."""
+        row = self.connection.execute("SELECT MAX(ts) FROM features WHERE user = ? AND date = ?", (user, date)).fetchone()
+        return row[0]
+
+    def delete_dates(self, user, dates):
+        """Remove the rows and source hashes of the given dates."""
+        with self.connection:
+            for date in dates:
+                self.connection.execute("DELETE FROM features WHERE user = ? AND date = ?", (user, date))
+                self.connection.execute("DELETE FROM sources WHERE user = ? AND date = ?", (user, date))
+        self.cache.clear()
+
+    def sources(self, user):
+        """`{date: hash}` of the raw data each stored date was computed from."""
+        return dict(self.connection.execute("SELECT date, hash FROM sources WHERE user = ?", (user,)).fetchall())
+
+    def set_source(self, user, date, source_hash):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO sources (user, date, hash) VALUES (?, ?, ?)",
+                                    (user, date, source_hash))
+
+    def close(self):
+        self.connection.close()
+
+    def _check_version(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is not None and int(row[0]) == self.version:
+            return
+        with self.connection:
+            self.connection.execute("DELETE FROM features")
+            self.connection.execute("DELETE FROM sources")
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                                    (str(self.version),))
+
+    def _remember(self, key, values):
+        self.cache[key] = values
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _frame(self, slots, rows):
+        df = pd.DataFrame.from_records(rows) if rows else pd.DataFrame()
+        df.insert(0, 'timestamp', from_epoch_ms(slots))
+        return df
+
+    @staticmethod
+    def _to_ms(timestamps):
+        """Start of the grid slot of each timestamp (tz-aware or epoch ms), in epoch ms."""
+        if isinstance(timestamps, datetime):
+            ts = pd.Timestamp(timestamps).as_unit("ms").asm8.astype(np.int64)
+        elif isinstance(timestamps, (int, np.integer)):
+            ts = timestamps
+        else:
+            ts = to_epoch_ms(pd.Series(timestamps))
+        slots = floor_to_grid(ts, grid_step())
+        return slots if isinstance(slots, np.ndarray) else int(slots)
@@ -1,21 +1,30 @@
 import os
+import numpy as np
 import pandas as pd
 import json
-from datetime import datetime, timedelta
 import sys
+import argparse
 
-def round_down_to_even_minutes(timestamp):
-    """Round down timestamp minutes to nearest even number and format consistently"""
-    rounded_minute = timestamp.minute - (timestamp.minute % 2)
-    rounded_time = timestamp.replace(minute=rounded_minute, second=0, microsecond=0)
-    return rounded_time.strftime("%Y-%m-%dT%H:%M:00")
+# Get the root directory path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add root directory to Python path
+sys.path.append(ROOT_DIR)
+
+from data_processing.timestamps import LOCAL_FORMAT, localize_wall_clock, from_epoch_ms, to_epoch_ms
+from data_processing.conversion.resample import GRID_MINUTES, grid_step, grid_positions, floor_to_grid, to_grid, take_rows
+from data_processing.storage import (DatasetStore, GARMIN_DATASET, COMBINED_EMOTION_DATASET,
+                                     MERGED_DATASET, LABELLED_DATASET)
+
+def round_down_to_even_minutes(timestamps):
+    """Round naive timestamps down to the start of their grid slot (an even minute)"""
+    return timestamps.dt.floor(f"{GRID_MINUTES}min")
 
 def load_app_data(app_data_path):
     """Load and process app emotion data"""
     app_data = pd.read_csv(app_data_path)
     print("Successfully loaded app data")
-    # Remove Z suffix from timestamp column
-    app_data['timestamp'] = app_data['timestamp'].str.replace('Z', '')
+    # Remove Z suffix from timestamp column; the app records local wall-clock time
+    app_data['timestamp'] = localize_wall_clock(app_data['timestamp'].str.replace('Z', ''))
     print("\nApp data shape:", app_data.shape)
     return app_data
 
@@ -30,7 +39,7 @@ def load_manual_data(manual_data_path):
         
         # Convert timestamp to datetime and round to even minutes
         manual_df['timestamp'] = pd.to_datetime(manual_df['timestamp'])
-        manual_df['timestamp'] = manual_df['timestamp'].apply(round_down_to_even_minutes)
+        manual_df['timestamp'] = localize_wall_clock(round_down_to_even_minutes(manual_df['timestamp']))
         
         print("\nManual data shape:", manual_df.shape)
         return manual_df
@@ -38,14 +47,13 @@ def load_manual_data(manual_data_path):
         print(f"Error loading manual data: {e}")
         return pd.DataFrame()
 
-def load_health_data(health_data_path):
+def load_health_data(store):
     """Load and process health data"""
-    health_data = pd.read_csv(health_data_path)
+    health_data = store.read(GARMIN_DATASET)
     print("Successfully loaded health data")
     
-    # Drop timestamp column and rename local_time to timestamp
+    # Drop the UTC timestamp column and use local time as the timestamp
     health_data = health_data.drop(columns=['timestamp'])
-    # health_data = health_data.rename(columns={'timestamp': 'GMT_timestamp'})
     health_data = health_data.rename(columns={'local_time': 'timestamp'})
     
     print("\nHealth data shape:", health_data.shape)
@@ -67,16 +75,29 @@ def combine_emotion_data(app_data, manual_df):
 
 def merge_datasets(health_data, non_missing_df):
     """Merge health data with emotion data"""
-    # Merge on timestamps
-    merged_data = pd.merge(health_data, non_missing_df, on='timestamp', how='left')
+    # Each label belongs to the grid slot it falls in
+    labels = non_missing_df.copy()
+    slots = floor_to_grid(to_epoch_ms(labels['timestamp']), grid_step())
+    labels['timestamp'] = from_epoch_ms(slots).tz_convert(health_data['timestamp'].dt.tz)
+    merged_data = pd.merge(health_data, labels, on='timestamp', how='left')
     print("\nMerged data shape:", merged_data.shape)
     return merged_data
 
+def label_health_data(non_missing_df, health_data):
+    """Attach to each label the health data of its grid slot"""
+    # Lay the health data out on a contiguous grid, so a slot's row is its position
+    grid = to_grid(health_data)
+    if grid.empty:
+        positions = np.full(len(non_missing_df), -1)
+    else:
+        positions = grid_positions(to_epoch_ms(grid['timestamp'])[0], to_epoch_ms(non_missing_df['timestamp']), grid_step())
+    health = take_rows(grid, positions).drop(columns=['timestamp'])
+    return pd.concat([non_missing_df.reset_index(drop=True), health], axis=1)
+
 def main():
-    # Get the root directory path
-    ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    # Add root directory to Python path
-    sys.path.append(ROOT_DIR)
+    parser = argparse.ArgumentParser(description='Merge Garmin health data with emotion labels')
+    parser.add_argument('--csv', action='store_true', help='Also export the merged datasets as CSV')
+    args = parser.parse_args()
     
     # Set working directory to root
     os.chdir(ROOT_DIR)
@@ -85,17 +106,12 @@ def main():
     DATA_DIR = "data"
     app_data_path = os.path.join(ROOT_DIR, 'my-va-app', DATA_DIR, 'emotion_data.csv')
     manual_data_path = os.path.join(DATA_DIR, 'raw/emotion_data.json')
-    health_data_path = os.path.join(DATA_DIR, 'processed/garmin_data.csv')
+    store = DatasetStore(DATA_DIR)
     
     # Load and process data
     app_data = load_app_data(app_data_path)
     manual_df = load_manual_data(manual_data_path)
-    health_data = load_health_data(health_data_path)
-    
-    # make sure all timestamps are in format YYYY-MM-DD HH:MM:SS
-    app_data['timestamp'] = pd.to_datetime(app_data['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
-    manual_df['timestamp'] = pd.to_datetime(manual_df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
-    health_data['timestamp'] = pd.to_datetime(health_data['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
+    health_data = load_health_data(store)
     
     # Combine emotion data
     combined_df = combine_emotion_data(app_data, manual_df)
@@ -110,12 +126,17 @@ def main():
     merged_data = merge_datasets(health_data, non_missing_df)
     
     # Create labelled data
-    labelled_data = pd.merge(non_missing_df, health_data, on='timestamp', how='left')
+    labelled_data = label_health_data(non_missing_df, health_data)
     
     # Save results
-    combined_df.to_csv(os.path.join(DATA_DIR, 'merged/combined_emotion_data.csv'), index=False)
-    merged_data.to_csv(os.path.join(DATA_DIR, 'merged/merged_data.csv'), index=False)
-    labelled_data.to_csv(os.path.join(DATA_DIR, 'merged/labelled_data.csv'), index=False)
+    store.write(COMBINED_EMOTION_DATASET, combined_df)
+    store.write(MERGED_DATASET, merged_data, partition_on='timestamp')
+    store.write(LABELLED_DATASET, labelled_data)
+    
+    # Export to CSV, with timestamps in format YYYY-MM-DD HH:MM:SS
+    if args.csv:
+        for name, df in [(COMBINED_EMOTION_DATASET, combined_df), (MERGED_DATASET, merged_data), (LABELLED_DATASET, labelled_data)]:
+            store.export_csv(name, formats={'timestamp': LOCAL_FORMAT}, df=df)
     
     print("\n✅ All data saved successfully!")
 
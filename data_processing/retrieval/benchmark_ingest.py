@@ -0,0 +1,83 @@
+"""
+Benchmarks `fetch_garmin_health_data` against recorded or synthetic Garmin
+payloads, without touching Garmin Connect or the real raw store.
+
+Reports days/sec and calls/sec for the chosen worker count and rate limit.
+Use `--http` to go through the local replay server instead of calling the
+fixture client in-process.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)
+
+from api.garmin_replay import FixtureGarmin, ReplayGarmin, make_server
+from data_processing.retrieval.last_x_days import fetch_garmin_health_data
+from data_processing.retrieval.raw_store import RawStore
+from data_processing.retrieval.ingest_stats import IngestStats
+from colorama import Fore, Style
+
+
+def run_benchmark(days=75, workers=1, requests_per_second=None, fixtures=None,
+                  latency=0.05, jitter=0.0, error_rate=0.0, http=False):
+    """Run one backfill against the fixtures and return its throughput figures."""
+    fixture_client = FixtureGarmin(fixtures, latency=latency, jitter=jitter, error_rate=error_rate, seed=0)
+
+    server = None
+    client = fixture_client
+    if http:
+        server = make_server(fixture_client, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = ReplayGarmin(f"http://127.0.0.1:{server.server_port}")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = RawStore(os.path.join(tmp_dir, "garmin"))
+            stats = IngestStats()
+            start = time.perf_counter()
+            fetch_garmin_health_data(days=days, workers=workers, requests_per_second=requests_per_second,
+                                     force=True, client=client, store=store, stats=stats)
+            elapsed = time.perf_counter() - start
+            stored_days = len(store.dates())
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    return {
+        "days": days + 1,
+        "stored_days": stored_days,
+        "calls": client.calls,
+        "throttled": client.throttled,
+        "seconds": elapsed,
+        "days_per_sec": (days + 1) / elapsed,
+        "calls_per_sec": client.calls / elapsed,
+        "stats": stats.summary(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Garmin ingest against recorded or synthetic payloads')
+    parser.add_argument('--days', type=int, default=75, help='Number of days to fetch (default: 75)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of concurrent requests (default: 1, serial)')
+    parser.add_argument('--rps', type=float, default=None, help='Maximum requests per second (default: no limit)')
+    parser.add_argument('--fixtures', type=str, default=None, help='Fixture directory (<date>/<endpoint>.json)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated latency per call in seconds (default: 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- jitter per call in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with 429')
+    parser.add_argument('--http', action='store_true', help='Go through the local replay server')
+    args = parser.parse_args()
+
+    result = run_benchmark(args.days, args.workers, args.rps, args.fixtures,
+                           args.latency, args.jitter, args.error_rate, args.http)
+
+    print(Fore.CYAN + "\n=== Ingest benchmark ===" + Style.RESET_ALL)
+    print(f"Days requested: {result['days']} (stored: {result['stored_days']})")
+    print(f"Calls: {result['calls']} ({result['throttled']} throttled)")
+    print(f"Elapsed: {result['seconds']:.2f}s")
+    print(f"Throughput: {result['days_per_sec']:.2f} days/sec, {result['calls_per_sec']:.2f} calls/sec")
@@ -0,0 +1,109 @@
+"""
+Works out the smallest set of Garmin endpoints and days needed to build the
+features the trained models consume.
+
+The feature lists are read from the pipelines saved next to the models (or,
+for models trained before pipelines were saved, the scalers'
+`feature_names_in_`), so the plan follows the models when they are retrained.
+"""
+import os
+from datetime import timedelta
+
+import joblib
+
+from data_processing.cleaning.rolling_features import feature_specs, window_slots
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TRAINED_DIR = os.path.join(ROOT_DIR, "models", "trained")
+TARGETS = ("valence", "arousal")
+
+# Garmin endpoint each model feature is derived from (None = derived from the timestamp)
+FEATURE_ENDPOINTS = {
+    "heart_rate": "heart_rate",
+    "hr_1": "heart_rate",
+    "hr_2": "heart_rate",
+    "hr_change_now": "heart_rate",
+    "hr_change_2min": "heart_rate",
+    "stress": "stress",
+    "respiration": "respiration",
+    "body_battery": "body_battery",
+    "spo2": "spo2",
+    "hrv_avg": "hrv",
+    "hrv": "hrv",
+    "sleep_score": "sleep",
+}
+
+# How many 2-minute steps back each lag feature looks
+FEATURE_LAGS = {
+    "hr_1": 1,
+    "hr_2": 2,
+    "hr_change_now": 1,
+    "hr_change_2min": 2,
+}
+
+# Rolling-window features come from their signal's endpoint and look back over their window
+ROLLING_SPECS = feature_specs()
+FEATURE_ENDPOINTS.update({name: signal for name, (signal, _, _) in ROLLING_SPECS.items()})
+FEATURE_LAGS.update({name: window_slots(minutes) - 1 for name, (_, _, minutes) in ROLLING_SPECS.items()})
+
+# Columns of the processed frame that each endpoint fills
+ENDPOINT_COLUMNS = {
+    "heart_rate": ["heart_rate"],
+    "stress": ["stress"],
+    "respiration": ["respiration"],
+    "sleep": ["sleep_score"],
+    "body_battery": ["body_battery"],
+    "spo2": ["spo2"],
+    "hrv": ["hrv_avg", "hrv"],
+}
+
+
+def load_model_features(model_dir=TRAINED_DIR, targets=TARGETS):
+    """Return `{target: [feature, ...]}` from the pipelines (or scalers) saved with the models."""
+    features = {}
+    for target in targets:
+        pipeline_path = os.path.join(model_dir, f"{target}_pipeline.joblib")
+        if os.path.exists(pipeline_path):
+            features[target] = list(joblib.load(pipeline_path).named_steps["features"].columns)
+            continue
+        scaler = joblib.load(os.path.join(model_dir, f"{target}_scaler.joblib"))
+        if not hasattr(scaler, "feature_names_in_"):
+            raise ValueError(f"{target}_scaler.joblib was fitted without feature names")
+        features[target] = list(scaler.feature_names_in_)
+    return features
+
+
+def plan_endpoints(features):
+    """Return the endpoints needed for the given features, in fetch order.
+
+    Heart rate is always included because it defines the rows of the
+    processed data.
+    """
+    needed = {"heart_rate"}
+    for feature in features:
+        if feature.startswith("sleep_tier_"):
+            needed.add("sleep")
+        elif FEATURE_ENDPOINTS.get(feature):
+            needed.add(FEATURE_ENDPOINTS[feature])
+    return [endpoint for endpoint in ENDPOINT_COLUMNS if endpoint in needed]
+
+
+def plan_dates(target_dt, features, step_minutes=2):
+    """Return the local dates covering the target timestamp and its lags."""
+    max_lag = max([FEATURE_LAGS.get(feature, 0) for feature in features] + [0])
+    timestamps = [target_dt - timedelta(minutes=step_minutes * lag) for lag in range(max_lag + 1)]
+    return sorted({ts.strftime("%Y-%m-%d") for ts in timestamps})
+
+
+def build_fetch_plan(target_dt, model_dir=TRAINED_DIR):
+    """Return `{date: [endpoint, ...]}` for a prediction at `target_dt`."""
+    features = sorted({feature for target_features in load_model_features(model_dir).values()
+                       for feature in target_features})
+    endpoints = plan_endpoints(features)
+    return {date: endpoints for date in plan_dates(target_dt, features)}
+
+
+def unplanned_columns(plan):
+    """Return processed-data columns whose endpoint is not in the plan."""
+    planned = {endpoint for endpoints in plan.values() for endpoint in endpoints}
+    return [column for endpoint, columns in ENDPOINT_COLUMNS.items() if endpoint not in planned for column in columns]
@@ -0,0 +1,82 @@
+"""
+The Garmin endpoints we fetch and how their payloads are turned into the
+fields of a stored day.
+"""
+
+# Garmin client method used for each endpoint, in the order they are fetched
+ENDPOINTS = {
+    "heart_rate": "get_heart_rates",  # Heart Rate Data
+    "stress": "get_stress_data",  # Stress Data
+    "respiration": "get_respiration_data",  # Respiration Rate
+    "sleep": "get_sleep_data",  # Sleep Data
+    "body_battery": "get_body_battery",  # Body Battery
+    "spo2": "get_spo2_data",  # SpO2 (Oxygen Saturation)
+    "hrv": "get_hrv_data",
+}
+
+def fetch_endpoint(client, endpoint, date, limiter=None):
+    """Call a single Garmin endpoint for one date, respecting the rate limiter."""
+    if limiter:
+        limiter.wait()
+    return getattr(client, ENDPOINTS[endpoint])(date)
+
+def build_day_entry(payloads):
+    """Extract the stored metrics from the raw payloads of one day."""
+    hr_data = payloads.get("heart_rate")
+    stress_data = payloads.get("stress")
+    respiration_data = payloads.get("respiration")
+    sleep_data = payloads.get("sleep")
+    body_battery_data = payloads.get("body_battery")
+    sp02_data = payloads.get("spo2")
+    hrv_data = payloads.get("hrv")
+
+    # Extract sleep score from the nested structure
+    sleep_score = None
+    if sleep_data and isinstance(sleep_data, dict):
+        try:
+            sleep_score = (sleep_data
+                .get("dailySleepDTO", {})
+                .get("sleepScores", {})
+                .get("overall", {})
+                .get("value"))
+            print("Found sleep score")
+            print(sleep_score)
+        except (AttributeError, TypeError):
+            sleep_score = None
+
+    # Extract heart rate values (timestamps & HR readings)
+    heart_rate_values = hr_data.get("heartRateValues", None) if hr_data else None
+
+    hrv_readings = hrv_data.get("hrvReadings", []) if hrv_data else []
+    hrv_values = {entry["readingTimeGMT"]: entry["hrvValue"] for entry in hrv_readings} if hrv_readings else None
+
+    # Get HRV average from the summary
+    hrv_avg = hrv_data.get("hrvSummary", {}).get("lastNightAvg") if hrv_data else None
+
+    entry = {
+        "heart_rate": heart_rate_values if heart_rate_values else None,
+        "stress": stress_data if stress_data else None,
+        "respiration": respiration_data if respiration_data else None,
+        "sleep_score": sleep_score,
+        "body_battery": body_battery_data if body_battery_data else None,
+        "spo2": sp02_data if sp02_data else None,
+        "hrv": hrv_values if hrv_values else None,
+        "hrv_avg": hrv_avg
+    }
+    return entry
+
+def series_of(endpoint, container):
+    """Return the `[timestamp_ms, value]` list of a time-series payload, or None."""
+    if not container:
+        return None
+    if endpoint == "heart_rate":
+        return container.get("heartRateValues") if isinstance(container, dict) else container
+    if endpoint == "stress":
+        return container.get("stressValuesArray")
+    if endpoint == "respiration":
+        return container.get("respirationValuesArray")
+    if endpoint == "body_battery":
+        return container[0].get("bodyBatteryValuesArray") if isinstance(container, list) else None
+    if endpoint == "spo2":
+        return container.get("spO2HourlyAverages")
+    return None
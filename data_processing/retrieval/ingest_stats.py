@@ -0,0 +1,129 @@
+"""
+Instrumentation for Garmin ingest runs.
+
+Every endpoint call attempt is recorded with its latency, payload size,
+sample count, whether it was a retry and the error class if it failed.
+`IngestStats.summary()` aggregates this per endpoint and per day, and is
+written as `ingest_stats.json` next to the raw store at the end of a
+command-line fetch.
+"""
+import json
+import threading
+from collections import Counter, defaultdict
+
+from colorama import Fore, Style
+
+from data_processing.retrieval.garmin_endpoints import series_of
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+
+
+def payload_size(payload):
+    """Approximate bytes received: the compact JSON encoding of the payload."""
+    if payload is None:
+        return 0
+    return len(json.dumps(payload, separators=(",", ":")))
+
+
+def sample_count(endpoint, payload):
+    """Number of readings in a payload (1 for daily summaries, 0 if empty)."""
+    if not payload:
+        return 0
+    if endpoint == "hrv":
+        return len(payload.get("hrvReadings") or []) if isinstance(payload, dict) else 0
+    samples = series_of(endpoint, payload)
+    return len(samples) if samples is not None else 1
+
+
+class EndpointStats:
+    """Running totals for one endpoint."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.errors = Counter()
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS_MS)
+        self.bytes = 0
+        self.samples = 0
+
+    def add(self, latency, size, samples, retry, error):
+        self.calls += 1
+        self.retries += retry
+        if error is not None:
+            self.errors[type(error).__name__] += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        latency_ms = latency * 1000
+        self.histogram[next(i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound)] += 1
+        self.bytes += size
+        self.samples += samples
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "errors": dict(self.errors),
+            "latency_total_s": round(self.latency_total, 4),
+            "latency_mean_ms": round(self.latency_total / self.calls * 1000, 2) if self.calls else None,
+            "latency_max_ms": round(self.latency_max * 1000, 2),
+            "latency_histogram_ms": {
+                ("inf" if bound == float("inf") else f"<={bound}"): count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.histogram)
+            },
+            "bytes": self.bytes,
+            "samples": self.samples,
+        }
+
+
+class IngestStats:
+    """Thread-safe collector for per-endpoint and per-day ingest metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+        self.days = defaultdict(lambda: defaultdict(EndpointStats))
+
+    def record(self, endpoint, date, latency, payload=None, error=None, retry=False):
+        """Record one call attempt."""
+        size = payload_size(payload)
+        samples = sample_count(endpoint, payload)
+        with self._lock:
+            self.endpoints[endpoint].add(latency, size, samples, retry, error)
+            self.days[date][endpoint].add(latency, size, samples, retry, error)
+
+    def summary(self):
+        """Return the machine-readable summary of the run."""
+        with self._lock:
+            endpoints = {endpoint: stats.summary() for endpoint, stats in self.endpoints.items()}
+            days = {
+                date: {endpoint: stats.summary() for endpoint, stats in day.items()}
+                for date, day in sorted(self.days.items())
+            }
+        return {
+            "totals": {
+                "calls": sum(s["calls"] for s in endpoints.values()),
+                "retries": sum(s["retries"] for s in endpoints.values()),
+                "errors": sum(sum(s["errors"].values()) for s in endpoints.values()),
+                "bytes": sum(s["bytes"] for s in endpoints.values()),
+                "samples": sum(s["samples"] for s in endpoints.values()),
+            },
+            "endpoints": endpoints,
+            "days": days,
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def print_summary(self):
+        """Print per-endpoint totals, slowest endpoint first."""
+        endpoints = self.summary()["endpoints"]
+        print(Fore.CYAN + "\nIngest stats per endpoint:" + Style.RESET_ALL)
+        print(f"{'endpoint':<14}{'calls':>7}{'retries':>9}{'errors':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'KiB':>10}{'samples':>10}")
+        for endpoint, s in sorted(endpoints.items(), key=lambda item: -item[1]["latency_total_s"]):
+            print(f"{endpoint:<14}{s['calls']:>7}{s['retries']:>9}{sum(s['errors'].values()):>8}"
+                  f"{s['latency_total_s']:>10.2f}{s['latency_mean_ms'] or 0:>10.1f}{s['latency_max_ms']:>10.1f}"
+                  f"{s['bytes'] / 1024:>10.1f}{s['samples']:>10}")
@@ -8,7 +8,10 @@ Fetches Garmin health data including:
 - SpO2
 - HRV Average
 
-Saves the data as `garmin_health_data.json`
+Each day is kept in the date-partitioned raw store (`data/raw/garmin/`).
+Run from the command line, the full history is also exported as
+`garmin_health_data.bin` (see `raw_format`), plus `garmin_health_data.json`
+when requested
 """
 import os
 import sys
@@ -24,8 +27,11 @@ os.chdir(ROOT_DIR)
 print("\nCurrent working directory: ", os.getcwd())
 
 from api.garmin_login import login_to_garmin
+from data_processing.retrieval.raw_store import RawStore
+from data_processing.retrieval.garmin_endpoints import ENDPOINTS, build_day_entry
+from data_processing.retrieval.scheduler import FetchScheduler, DeadLetters
+from data_processing.retrieval.ingest_stats import IngestStats
 from datetime import datetime, timedelta
-import json
 from colorama import Fore, Style
 
 DATA_DIR = "data/raw/"
@@ -33,94 +39,119 @@ print(os.getcwd())
 
 os.makedirs(DATA_DIR, exist_ok=True)  # Ensure directory exists
 jsonfile = "garmin_health_data.json"
-
-def fetch_garmin_health_data(days=75, target_date=None):
+rawfile = "garmin_health_data.bin"
+statsfile = "ingest_stats.json"
+
+def fetch_garmin_health_data(days=75, target_date=None, workers=1, requests_per_second=None, force=False, plan=None,
+                             client=None, store=None, export=False, export_json=False, stats=None):
+    """Fetch Garmin health data into the raw store and return `{date: health}` of the fetched days.
+
+    Only days that are missing from the store or were fetched before the day
+    was over are requested again, unless `force` is set. A `plan` of
+    `{date: [endpoint, ...]}` (see `fetch_plan.build_fetch_plan`) restricts
+    the fetch to those dates and endpoints instead of `days`/`target_date`.
+    Calls go through a `FetchScheduler`: transient failures and 429s are
+    retried with backoff, concurrency adapts between 1 and `workers`, and
+    `requests_per_second` caps the overall request rate. Days that still fail
+    are dead-lettered and retried by the next backfill. `client` and `store`
+    default to the shared Garmin session and the `data/raw/garmin` store.
+    Per-endpoint call metrics are collected in `stats` (a new `IngestStats`
+    if not given). `export` writes the whole history as
+    `garmin_health_data.bin` and the metrics as `ingest_stats.json` next to
+    the raw store; `export_json` also writes `garmin_health_data.json`.
+    Conversion reads the raw store directly, so neither is needed to
+    convert.
+    """
     # Authenticate and get Garmin client
-    client = login_to_garmin()
+    if client is None:
+        client = login_to_garmin()
 
     if client:
         print("\nFetching Garmin health data. Press Ctrl+C to stop.\n")
 
-        if target_date:
-            # If target_date is provided, fetch only that date
-            today = datetime.strptime(target_date, "%Y-%m-%d")
-            start_date = today
-            days = 0  # Only fetch one day
-            print(f"Fetching data for specific date: {target_date}")
+        # Only backfills (no caller plan) pick up days left on the dead-letter list
+        backfill = plan is None
+        if plan is not None:
+            # Fetch only the dates and endpoints the caller asked for
+            dates = sorted(plan, reverse=True)
+            print(f"Fetching planned data for {', '.join(dates)}")
         else:
-            # Otherwise fetch the last X days
-            today = datetime.today()
-            start_date = today - timedelta(days=days)
-            print(f"Fetching health data from {start_date.strftime('%Y-%m-%d')} to {today.strftime('%Y-%m-%d')}")
-
-        health_data = {}
-
-        for i in range(days + 1):
-            date = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-            try:
-                # Fetch all required metrics
-                hr_data = client.get_heart_rates(date)  # Heart Rate Data
-                stress_data = client.get_stress_data(date)  # Stress Data
-                respiration_data = client.get_respiration_data(date)  # Respiration Rate
-                sleep_data = client.get_sleep_data(date)  # Sleep Data
-                body_battery_data = client.get_body_battery(date)  # Body Battery
-                sp02_data = client.get_spo2_data(date)  # SpO2 (Oxygen Saturation)
-                hrv_data = client.get_hrv_data(date)
-
-                # Extract sleep score from the nested structure
-                sleep_score = None
-                if sleep_data and isinstance(sleep_data, dict):
-                    try:
-                        sleep_score = (sleep_data
-                            .get("dailySleepDTO", {})
-                            .get("sleepScores", {})
-                            .get("overall", {})
-                            .get("value"))
-                        print("Found sleep score")
-                        print(sleep_score)
-                    except (AttributeError, TypeError):
-                        sleep_score = None
-
-                # Extract heart rate values (timestamps & HR readings)
-                heart_rate_values = hr_data.get("heartRateValues", None) if hr_data else None
-                
-                hrv_readings = hrv_data.get("hrvReadings", []) if hrv_data else []
-                hrv_values = {entry["readingTimeGMT"]: entry["hrvValue"] for entry in hrv_readings} if hrv_readings else None
-                
-                # Get HRV average from the summary
-                hrv_avg = hrv_data.get("hrvSummary", {}).get("lastNightAvg") if hrv_data else None
-                
-                # Store data for the date
-                health_data[date] = {
-                    "heart_rate": heart_rate_values if heart_rate_values else None,
-                    "stress": stress_data if stress_data else None,
-                    "respiration": respiration_data if respiration_data else None,
-                    "sleep_score": sleep_score,
-                    "body_battery": body_battery_data if body_battery_data else None,
-                    "spo2": sp02_data if sp02_data else None,
-                    "hrv": hrv_values if hrv_values else None,
-                    "hrv_avg": hrv_avg
-                }
-
-                # If we have a sleep score, store it for the next day as well
-                if sleep_score is not None:
-                    next_date = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-                    if next_date not in health_data:
-                        health_data[next_date] = {}
-                    health_data[next_date]["previous_night_sleep_score"] = sleep_score
-
-                print(Fore.GREEN + f"Retrieved health data for {date}" + Style.RESET_ALL)
-
-            except Exception as e:
-                print(Fore.RED + f"Error fetching data for {date}: {e}" + Style.RESET_ALL)
-                health_data[date] = None
-
-        # Save to JSON file
-        json_filename = os.path.join(DATA_DIR, jsonfile)
-        with open(json_filename, "w") as json_file:
-            json.dump(health_data, json_file, indent=4)
-
-        print(Fore.CYAN + f"\nHealth data saved to {json_filename}" + Style.RESET_ALL)
+            if target_date:
+                # If target_date is provided, fetch only that date
+                today = datetime.strptime(target_date, "%Y-%m-%d")
+                start_date = today
+                days = 0  # Only fetch one day
+                print(f"Fetching data for specific date: {target_date}")
+            else:
+                # Otherwise fetch the last X days
+                today = datetime.today()
+                start_date = today - timedelta(days=days)
+                print(f"Fetching health data from {start_date.strftime('%Y-%m-%d')} to {today.strftime('%Y-%m-%d')}")
+
+            dates = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days + 1)]
+            plan = {date: list(ENDPOINTS) for date in dates}
+
+        store = store or RawStore()
+        dead_letters = DeadLetters(store.root)
+
+        # Work out which planned endpoints are missing or stale for each date
+        manifest = store.manifest()
+        pending = {}
+        for date in dates:
+            endpoints = [endpoint for endpoint in ENDPOINTS if endpoint in plan[date]]
+            if not force:
+                endpoints = store.stale_endpoints(date, endpoints, manifest)
+            if endpoints:
+                pending[date] = endpoints
+        print(f"{len(dates) - len(pending)} days up to date, fetching {len(pending)} days "
+              f"({sum(len(endpoints) for endpoints in pending.values())} requests)")
+
+        # Backfills also retry days that failed in earlier runs
+        if backfill:
+            for date, letter in dead_letters.load().items():
+                endpoints = set(pending.get(date, [])) | set(letter["endpoints"])
+                pending[date] = [endpoint for endpoint in ENDPOINTS if endpoint in endpoints]
+                print(Fore.YELLOW + f"Retrying {date} from the dead-letter list ({letter['error']})" + Style.RESET_ALL)
+
+        if workers > 1:
+            print(f"Using up to {workers} workers" + (f" at {requests_per_second} requests/s" if requests_per_second else ""))
+        stats = stats if stats is not None else IngestStats()
+        scheduler = FetchScheduler(client, max_workers=workers, requests_per_second=requests_per_second, stats=stats)
+
+        fetched = []
+        for date, payloads in scheduler.fetch(pending):
+            if isinstance(payloads, Exception):
+                # Leave the stored day untouched and keep it for a later run
+                print(Fore.RED + f"Error fetching data for {date}: {payloads}" + Style.RESET_ALL)
+                dead_letters.add(date, pending[date], payloads)
+                continue
+
+            # Merge the fetched metrics into the stored day
+            entry = build_day_entry(payloads)
+            store.write_day(date, entry, pending[date])
+            dead_letters.remove(date)
+            fetched.append(date)
+
+            print(Fore.GREEN + f"Retrieved health data for {date}" + Style.RESET_ALL)
+
+        # Export the whole history as single files
+        if export:
+            raw_filename = os.path.join(os.path.dirname(store.root), rawfile)
+            store.export(raw_filename)
+            print(Fore.CYAN + f"\nHealth data saved to {raw_filename}" + Style.RESET_ALL)
+
+        if export_json:
+            json_filename = os.path.join(os.path.dirname(store.root), jsonfile)
+            store.export_json(json_filename)
+            print(Fore.CYAN + f"Health data exported to {json_filename}" + Style.RESET_ALL)
+
+        # Report where the fetch time and bytes went
+        stats.print_summary()
+        if export:
+            stats_filename = os.path.join(os.path.dirname(store.root), statsfile)
+            stats.write_json(stats_filename)
+            print(Fore.CYAN + f"Ingest stats saved to {stats_filename}" + Style.RESET_ALL)
+        return store.load(fetched)
 
     else:
         print("Could not log in to Garmin. Exiting.")
@@ -130,6 +161,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Fetch Garmin health data')
     parser.add_argument('--target_date', type=str, help='Specific date to fetch data for (YYYY-MM-DD)')
     parser.add_argument('--days', type=int, default=75, help='Number of days to fetch (default: 75)')
+    parser.add_argument('--workers', type=int, default=1, help='Maximum concurrent requests, adapted to rate limits (default: 1, serial)')
+    parser.add_argument('--rps', type=float, default=None, help='Maximum Garmin requests per second (default: no limit)')
+    parser.add_argument('--force', action='store_true', help='Re-fetch days that are already up to date in the raw store')
+    parser.add_argument('--export-json', action='store_true', help='Also export the history as garmin_health_data.json')
     args = parser.parse_args()
     
-    fetch_garmin_health_data(days=args.days, target_date=args.target_date)
+    fetch_garmin_health_data(days=args.days, target_date=args.target_date,
+                             workers=args.workers, requests_per_second=args.rps, force=args.force,
+                             export=True, export_json=args.export_json)
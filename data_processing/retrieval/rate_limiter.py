@@ -0,0 +1,25 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls to at most `per_second` per second."""
+
+    def __init__(self, per_second=None):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        """Block until the caller is allowed to make its next request."""
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
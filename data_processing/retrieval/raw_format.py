@@ -0,0 +1,129 @@
+"""
+Compact binary format for raw Garmin data.
+
+A file starts with a short magic header followed by one frame per day:
+
+    [codec: 1 byte][length: 4 bytes, big endian][payload: length bytes]
+
+The payload is `{"date": ..., "health": ...}` packed with msgpack and
+compressed with zstd. If those packages aren't installed, frames are written
+as zlib-compressed JSON instead; readers handle both codecs.
+
+Frames can be appended and read back one day at a time, so neither side has
+to hold the whole history in memory. JSON remains available as an export.
+"""
+import json
+import struct
+import zlib
+from collections import namedtuple
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:
+    msgpack = zstandard = None
+
+MAGIC = b"GRMN\x01"
+FRAME_HEADER = struct.Struct(">BI")
+
+CODEC_MSGPACK_ZSTD = 1
+CODEC_JSON_ZLIB = 2
+DEFAULT_CODEC = CODEC_MSGPACK_ZSTD if msgpack else CODEC_JSON_ZLIB
+
+
+def encode_frame(date, health, codec=DEFAULT_CODEC):
+    """Return the bytes of a single frame for one day."""
+    record = {"date": date, "health": health}
+    if codec == CODEC_MSGPACK_ZSTD:
+        payload = zstandard.ZstdCompressor(level=10).compress(msgpack.packb(record, use_bin_type=True))
+    elif codec == CODEC_JSON_ZLIB:
+        payload = zlib.compress(json.dumps(record, separators=(",", ":")).encode(), 6)
+    else:
+        raise ValueError(f"Unknown raw frame codec: {codec}")
+    return FRAME_HEADER.pack(codec, len(payload)) + payload
+
+
+def decode_frame(codec, payload):
+    """Return `(date, health)` from a frame's codec and payload."""
+    if codec == CODEC_MSGPACK_ZSTD:
+        if msgpack is None:
+            raise ImportError("msgpack and zstandard are required to read this raw file")
+        record = msgpack.unpackb(zstandard.ZstdDecompressor().decompress(payload), raw=False)
+    elif codec == CODEC_JSON_ZLIB:
+        record = json.loads(zlib.decompress(payload))
+    else:
+        raise ValueError(f"Unknown raw frame codec: {codec}")
+    return record["date"], record["health"]
+
+
+class RawDay(namedtuple("RawDay", ["date", "codec", "payload"])):
+    """A stored day as read from disk: an undecoded frame, or the decoded health if `codec` is None."""
+    __slots__ = ()
+
+    def decode(self):
+        """Return `(date, health)`."""
+        if self.codec is None:
+            return self.date, self.payload
+        return decode_frame(self.codec, self.payload)
+
+
+class FrameWriter:
+    """Streams day frames to a raw file, creating or appending to it."""
+
+    def __init__(self, path, append=False, codec=DEFAULT_CODEC):
+        self.codec = codec
+        self._file = open(path, "ab" if append else "wb")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def write(self, date, health):
+        self._file.write(encode_frame(date, health, self.codec))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_raw_frames(path):
+    """Yield the undecoded `(codec, payload)` of each frame in a raw file."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a raw Garmin frame file")
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if not header:
+                return
+            if len(header) < FRAME_HEADER.size:
+                raise ValueError(f"Truncated frame header in {path}")
+            codec, length = FRAME_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError(f"Truncated frame in {path}")
+            yield codec, payload
+
+
+def iter_frames(path):
+    """Yield `(date, health)` pairs from a raw file one frame at a time."""
+    for codec, payload in iter_raw_frames(path):
+        yield decode_frame(codec, payload)
+
+
+def write_frames(path, items, codec=DEFAULT_CODEC):
+    """Write an iterable of `(date, health)` pairs to a new raw file."""
+    with FrameWriter(path, codec=codec) as writer:
+        for date, health in items:
+            writer.write(date, health)
+
+
+def write_json(path, items):
+    """Write an iterable of `(date, health)` pairs as the `{date: health}` JSON layout, one day at a time."""
+    with open(path, "w") as f:
+        f.write("{")
+        for i, (date, health) in enumerate(items):
+            f.write(("," if i else "") + "\n    " + json.dumps(date) + ": " + json.dumps(health))
+        f.write("\n}\n")
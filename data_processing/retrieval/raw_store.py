@@ -0,0 +1,214 @@
+"""
+Date-partitioned store for raw Garmin health data.
+
+Each day lives in its own file under `data/raw/garmin/` (a single frame in
+the compact format of `raw_format`) and a manifest records when every
+endpoint was last fetched for that day, so repeated runs only fetch days
+that are missing or were fetched before the day was over.
+"""
+import os
+import re
+import json
+import hashlib
+import time
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from data_processing.retrieval.raw_format import (MAGIC, RawDay, encode_frame, iter_frames, iter_raw_frames, write_frames,
+                                                  write_json)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RAW_STORE_DIR = os.path.join(ROOT_DIR, "data", "raw", "garmin")
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+# Day files are named by date; other files in the store (manifest, cursors, dead letters) are sidecars
+DAY_FILE = re.compile(r"(\d{4}-\d{2}-\d{2})\.(bin|json)")
+
+# Fields of a stored day that each Garmin endpoint provides
+ENDPOINT_FIELDS = {
+    "heart_rate": ["heart_rate"],
+    "stress": ["stress"],
+    "respiration": ["respiration"],
+    "sleep": ["sleep_score"],
+    "body_battery": ["body_battery"],
+    "spo2": ["spo2"],
+    "hrv": ["hrv", "hrv_avg"],
+}
+
+# Hours after midnight before a finished day is considered fully synced
+SETTLE_HOURS = 2
+LOCK_TIMEOUT = 60
+
+
+class RawStore:
+    """One frame file per date plus a manifest of per-endpoint fetch times."""
+
+    def __init__(self, root=RAW_STORE_DIR, settle_hours=SETTLE_HOURS):
+        self.root = root
+        self.settle_hours = settle_hours
+        os.makedirs(self.root, exist_ok=True)
+
+    def day_path(self, date):
+        return os.path.join(self.root, f"{date}.bin")
+
+    def dates(self):
+        """Return all stored dates in ascending order."""
+        matches = (DAY_FILE.fullmatch(name) for name in os.listdir(self.root))
+        return sorted({match.group(1) for match in matches if match})
+
+    def read_day(self, date):
+        """Return the stored entry for a date, or None if it was never fetched."""
+        path = self.day_path(date)
+        if os.path.exists(path):
+            return next(health for _, health in iter_frames(path))
+
+        # Days written before the binary format was introduced
+        legacy_path = os.path.join(self.root, f"{date}.json")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "r") as f:
+                return json.load(f)
+        return None
+
+    def read_raw_day(self, date):
+        """Return the undecoded frame of a date as a `RawDay`.
+
+        Days still in the legacy JSON layout come back already decoded
+        (`codec` None).
+        """
+        path = self.day_path(date)
+        if os.path.exists(path):
+            return RawDay(date, *next(iter_raw_frames(path)))
+        return RawDay(date, None, self.read_day(date))
+
+    def content_hash(self, date):
+        """Return a hash of the stored bytes of a date, or None if it was never fetched."""
+        for path in (self.day_path(date), os.path.join(self.root, f"{date}.json")):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        return None
+
+    def manifest(self):
+        path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def is_stale(self, date, fetched_at):
+        """A fetch is stale if it happened before the day had settled."""
+        if fetched_at is None:
+            return True
+        settled_at = datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1, hours=self.settle_hours)
+        return datetime.fromisoformat(fetched_at) < settled_at
+
+    def stale_endpoints(self, date, endpoints=ENDPOINT_FIELDS, manifest=None):
+        """Return the endpoints that still need to be fetched for a date."""
+        fetched = (manifest if manifest is not None else self.manifest()).get(date, {})
+        return [endpoint for endpoint in endpoints if self.is_stale(date, fetched.get(endpoint))]
+
+    def write_day(self, date, entry, endpoints):
+        """Merge the fields of the fetched endpoints into the stored day."""
+        fetched_at = datetime.now().isoformat(timespec="seconds")
+
+        with self._locked():
+            day = self.read_day(date) or {}
+            for endpoint in endpoints:
+                for field in ENDPOINT_FIELDS[endpoint]:
+                    day[field] = entry.get(field)
+            self._write_day(date, day)
+
+            manifest = self.manifest()
+            manifest.setdefault(date, {}).update({endpoint: fetched_at for endpoint in endpoints})
+            self._write_json(os.path.join(self.root, MANIFEST_FILE), manifest)
+
+    def update_day(self, date, update):
+        """Apply `update(day)` to the stored day in place, without touching the manifest."""
+        with self._locked():
+            day = self.read_day(date) or {}
+            update(day)
+            self._write_day(date, day)
+
+    def iter_days(self, dates=None):
+        """Yield `(date, health)` for the given (or all) dates, newest first.
+
+        `previous_night_sleep_score` is filled in from the day before, as the
+        fetcher used to do when it built the whole file in one run.
+        """
+        for date in sorted(dates if dates is not None else self.dates(), reverse=True):
+            day = self.read_day(date)
+            if day is None:
+                continue
+            previous_date = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+            previous_day = self.read_day(previous_date)
+            if previous_day and previous_day.get("sleep_score") is not None:
+                day["previous_night_sleep_score"] = previous_day["sleep_score"]
+            yield date, day
+
+    def load(self, dates=None):
+        """Return `{date: health}` for the given (or all) dates, newest first."""
+        return dict(self.iter_days(dates))
+
+    def export(self, path):
+        """Stream the whole store into a single raw frame file, one day at a time."""
+        self._export(path, write_frames)
+
+    def export_json(self, path):
+        """Stream the whole store into a single `{date: health}` JSON file, one day at a time."""
+        self._export(path, write_json)
+
+    def _export(self, path, write):
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        write(tmp_path, self.iter_days())
+        os.replace(tmp_path, path)
+
+    def _write_day(self, date, day):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + encode_frame(date, day))
+        os.replace(tmp_path, self.day_path(date))
+
+        legacy_path = os.path.join(self.root, f"{date}.json")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def _write_json(self, path, data):
+        # Write to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _locked(self):
+        """Serialise read-modify-write cycles between processes."""
+        lock_path = os.path.join(self.root, LOCK_FILE)
+        started = time.monotonic()
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    lock_age = time.time() - os.path.getmtime(lock_path)
+                except FileNotFoundError:
+                    continue
+                # Break locks left behind by a crashed run
+                if lock_age > LOCK_TIMEOUT:
+                    try:
+                        os.remove(lock_path)
+                    except FileNotFoundError:
+                        pass
+                elif time.monotonic() - started > LOCK_TIMEOUT:
+                    raise TimeoutError(f"Timed out waiting for {lock_path}")
+                else:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
@@ -0,0 +1,182 @@
+"""
+Scheduler for Garmin endpoint calls that copes with rate limits.
+
+- Each call is retried with exponential backoff and full jitter on 429s and
+  connection errors.
+- The number of calls in flight follows AIMD: it grows by about one for
+  every window of successful calls and is halved on a 429.
+- Days that still fail after all retries go to a dead-letter file in the raw
+  store and are retried by the next run.
+"""
+import os
+import json
+import time
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from garminconnect import GarminConnectConnectionError, GarminConnectTooManyRequestsError
+
+from data_processing.retrieval.garmin_endpoints import fetch_endpoint
+from data_processing.retrieval.rate_limiter import RateLimiter
+
+RETRYABLE_ERRORS = (GarminConnectTooManyRequestsError, GarminConnectConnectionError, ConnectionError, TimeoutError)
+DEAD_LETTER_FILE = "dead_letter.json"
+
+
+def backoff_delay(attempt, base_delay, max_delay, rng=random):
+    """Exponential backoff with full jitter for the given (0-based) attempt."""
+    return rng.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class AIMDConcurrency:
+    """Concurrency limit that grows additively on success and shrinks multiplicatively on throttling."""
+
+    def __init__(self, initial=2, minimum=1, maximum=8, decrease_factor=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            # +1 per `limit` successes, i.e. roughly one step per round of calls
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class DeadLetters:
+    """Days (and endpoints) that failed after every retry, kept for a later run."""
+
+    def __init__(self, root):
+        self.path = os.path.join(root, DEAD_LETTER_FILE)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return `{date: {"endpoints": [...], "error": ..., "failed_at": ...}}`."""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def add(self, date, endpoints, error):
+        with self._lock:
+            letters = self.load()
+            previous = letters.get(date, {}).get("endpoints", [])
+            letters[date] = {
+                "endpoints": sorted(set(previous) | set(endpoints)),
+                "error": f"{type(error).__name__}: {error}",
+                "failed_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._save(letters)
+
+    def remove(self, date):
+        with self._lock:
+            letters = self.load()
+            if letters.pop(date, None) is not None:
+                self._save(letters)
+
+    def _save(self, letters):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(letters, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+class FetchScheduler:
+    """Runs Garmin endpoint calls with retries, backoff and AIMD concurrency."""
+
+    def __init__(self, client, max_workers=8, initial_concurrency=2, requests_per_second=None,
+                 max_retries=4, base_delay=1.0, max_delay=60.0, stats=None):
+        self.client = client
+        self.stats = stats
+        self.max_workers = max_workers
+        self.concurrency = AIMDConcurrency(initial=min(initial_concurrency, max_workers), maximum=max_workers)
+        self.limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, endpoint, date):
+        """Call one endpoint, retrying transient failures; raises once retries are exhausted."""
+        attempt = 0
+        while True:
+            with self.concurrency:
+                self.limiter.wait()
+                started = time.perf_counter()
+                try:
+                    result = fetch_endpoint(self.client, endpoint, date)
+                    self._record(endpoint, date, started, attempt, payload=result)
+                    self.concurrency.on_success()
+                    return result
+                except RETRYABLE_ERRORS as e:
+                    self._record(endpoint, date, started, attempt, error=e)
+                    if isinstance(e, GarminConnectTooManyRequestsError):
+                        self.concurrency.on_throttle()
+                    if attempt >= self.max_retries:
+                        raise
+                except Exception as e:
+                    self._record(endpoint, date, started, attempt, error=e)
+                    raise
+            # Back off outside the concurrency slot so other calls can proceed
+            time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+            attempt += 1
+
+    def _record(self, endpoint, date, started, attempt, payload=None, error=None):
+        if self.stats is not None:
+            self.stats.record(endpoint, date, time.perf_counter() - started, payload, error, retry=attempt > 0)
+
+    def fetch(self, plan):
+        """Fetch `{date: [endpoint, ...]}` and yield `(date, payloads)` as each date completes.
+
+        `payloads` is the exception that made the date fail if any of its
+        calls could not be completed.
+        """
+        remaining = {date: len(endpoints) for date, endpoints in plan.items()}
+        results = {date: {} for date in plan}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.call, endpoint, date): (date, endpoint)
+                for date, endpoints in plan.items()
+                for endpoint in endpoints
+            }
+            for future in as_completed(futures):
+                date, endpoint = futures[future]
+                try:
+                    payload = future.result()
+                    if not isinstance(results[date], Exception):
+                        results[date][endpoint] = payload
+                except Exception as e:
+                    if not isinstance(results[date], Exception):
+                        results[date] = e
+
+                remaining[date] -= 1
+                if remaining[date] == 0:
+                    yield date, results.pop(date)
@@ -0,0 +1,120 @@
+"""
+Intraday tail mode for live lamp updates.
+
+Instead of re-downloading the whole current day on every prediction, the
+tail reader remembers the newest sample it has ingested for each metric
+(`cursors.json` in the raw store). It only re-polls an endpoint once that
+metric's refresh interval has passed, and appends just the samples newer
+than the cursor to today's stored day.
+"""
+import os
+import json
+import time
+from datetime import datetime, timedelta
+
+from data_processing.retrieval.raw_store import RawStore, ENDPOINT_FIELDS
+from data_processing.retrieval.garmin_endpoints import ENDPOINTS, fetch_endpoint, build_day_entry, series_of
+
+CURSOR_FILE = "cursors.json"
+
+# Seconds between polls of each endpoint; roughly Garmin's sampling cadence
+REFRESH_INTERVALS = {
+    "heart_rate": 120,
+    "stress": 180,
+    "respiration": 120,
+    "body_battery": 180,
+    "spo2": 3600,
+    "sleep": 3600,
+    "hrv": 3600,
+}
+
+# Endpoints whose payload is a time series that can be appended to
+SERIES_ENDPOINTS = ("heart_rate", "stress", "respiration", "body_battery", "spo2")
+
+
+def last_timestamp(samples):
+    return max((ts for ts, _ in samples), default=None) if samples else None
+
+
+class TailReader:
+    """Keeps today's stored day up to date with as few and as small fetches as possible."""
+
+    def __init__(self, client, store=None, refresh_intervals=REFRESH_INTERVALS, stats=None):
+        self.client = client
+        self.stats = stats
+        self.store = store or RawStore()
+        self.refresh_intervals = refresh_intervals
+        self.cursor_path = os.path.join(self.store.root, CURSOR_FILE)
+
+    def cursors(self, date):
+        """Return `{endpoint: {"last_ts": ..., "polled_at": ...}}` for a date."""
+        if not os.path.exists(self.cursor_path):
+            return {}
+        with open(self.cursor_path, "r") as f:
+            return json.load(f).get(date, {})
+
+    def _save_cursors(self, date, cursors):
+        # Only today's cursors are worth keeping
+        self.store._write_json(self.cursor_path, {date: cursors})
+
+    def poll(self, endpoints=ENDPOINTS, now=None):
+        """Re-poll today's endpoints whose cursor is older than their refresh interval.
+
+        Returns `{endpoint: number of new samples}` for the endpoints polled.
+        """
+        now = now or time.time()
+        date = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+        cursors = self.cursors(date)
+        day = self.store.read_day(date) or {}
+        polled = {}
+
+        for endpoint in endpoints:
+            cursor = cursors.get(endpoint, {})
+            if now - cursor.get("polled_at", 0) < self.refresh_intervals.get(endpoint, 0):
+                continue
+
+            field = ENDPOINT_FIELDS[endpoint][0]
+            started = time.perf_counter()
+            payload = fetch_endpoint(self.client, endpoint, date)
+            if self.stats is not None:
+                self.stats.record(endpoint, date, time.perf_counter() - started, payload)
+            fetched = series_of(endpoint, payload)
+            stored = series_of(endpoint, day.get(field))
+
+            if endpoint not in SERIES_ENDPOINTS or stored is None:
+                # Daily metrics, or nothing stored yet: keep the whole payload
+                self.store.write_day(date, build_day_entry({endpoint: payload}), [endpoint])
+                day = self.store.read_day(date)
+                polled[endpoint] = len(fetched) if fetched else 0
+            else:
+                # Only append samples newer than both the cursor and what is stored
+                since = max((ts for ts in (cursor.get("last_ts"), last_timestamp(stored)) if ts is not None), default=None)
+                new_samples = [sample for sample in fetched or [] if since is None or sample[0] > since]
+                if new_samples:
+                    def append(stored_day):
+                        series_of(endpoint, stored_day[field]).extend(new_samples)
+                    self.store.update_day(date, append)
+                    stored.extend(new_samples)
+                polled[endpoint] = len(new_samples)
+
+            cursors[endpoint] = {
+                "last_ts": last_timestamp(series_of(endpoint, day.get(field))) or cursor.get("last_ts"),
+                "polled_at": now,
+            }
+
+        self._save_cursors(date, cursors)
+        return polled
+
+    def latest(self, endpoint, n, now=None):
+        """Return the newest `n` stored `[timestamp_ms, value]` samples of a metric.
+
+        Yesterday's samples are used as well when today doesn't have enough yet.
+        """
+        today = datetime.fromtimestamp(now or time.time())
+        samples = []
+        for date in (today, today - timedelta(days=1)):
+            day = self.store.read_day(date.strftime("%Y-%m-%d")) or {}
+            samples = (series_of(endpoint, day.get(ENDPOINT_FIELDS[endpoint][0])) or []) + samples
+            if len(samples) >= n:
+                break
+        return samples[-n:]
@@ -0,0 +1,73 @@
+"""
+Compact dtypes for the processed Garmin frame.
+
+Garmin metrics are small bounded integers, so they are stored as nullable
+int8/int16 (missing readings become `<NA>` instead of forcing float64).
+Respiration and heart rate (averaged per grid slot) can be fractional and
+are kept as float32. Every column always gets its schema dtype, whatever a
+day's values are, so all partitions of the processed dataset share one
+Arrow schema: values of an integer column are rounded, and values outside
+its range are treated as missing.
+"""
+import numpy as np
+import pandas as pd
+
+GARMIN_SCHEMA = {
+    "heart_rate": "float32",
+    "stress": "Int8",
+    "respiration": "float32",
+    "body_battery": "Int8",
+    "spo2": "Int8",
+    "sleep_score": "Int8",
+    "hrv_avg": "Int16",
+    "hrv": "Int16",
+}
+
+# Categorical features derived during cleaning
+CATEGORIES = {
+    "sleep_score_tier": pd.CategoricalDtype(["Poor", "Fair", "Good", "Excellent"], ordered=True),
+    "time_of_day": pd.CategoricalDtype(["Afternoon", "Evening", "Morning", "Night"]),
+}
+
+
+def to_integer(values, dtype):
+    """Round float `values` into a nullable integer array of `dtype`; out-of-range values become missing."""
+    info = np.iinfo(dtype.lower())
+    values = np.round(values)
+    values[(values < info.min) | (values > info.max)] = np.nan
+    return pd.array(values, dtype=dtype)
+
+
+def downcast(df, schema=GARMIN_SCHEMA):
+    """Return `df` with the schema's columns cast to their compact dtypes."""
+    df = df.copy()
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype.startswith("Int"):
+            values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            df[column] = to_integer(values, dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    for column, dtype in CATEGORIES.items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def widen(df, columns=GARMIN_SCHEMA):
+    """Cast the given compact columns back to float64, e.g. before imputing fractional values."""
+    return df.astype({column: "float64" for column in columns if column in df.columns})
+
+
+def memory_report(before, after):
+    """Print the memory used by each column before and after downcasting."""
+    before_bytes = before.memory_usage(deep=True, index=False)
+    after_bytes = after.memory_usage(deep=True, index=False)
+    print(f"\n{'column':<14}{'dtype before':<31}{'dtype after':<31}{'bytes before':>14}{'bytes after':>14}")
+    for column in before.columns:
+        print(f"{column:<14}{str(before[column].dtype):<31}{str(after[column].dtype):<31}"
+              f"{before_bytes[column]:>14,}{after_bytes[column]:>14,}")
+    total_before, total_after = before_bytes.sum(), after_bytes.sum()
+    ratio = f"  ({total_after / total_before:.0%} of before)" if total_before else ""
+    print(f"{'total':<14}{'':<62}{total_before:>14,}{total_after:>14,}{ratio}")
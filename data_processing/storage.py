@@ -0,0 +1,199 @@
+"""
+Storage layer for the processed, merged and final datasets.
+
+Stages read and write named datasets (e.g. `processed/garmin_data`) through
+a `DatasetStore` instead of passing CSV files around, so dtypes such as
+tz-aware timestamps and categoricals survive between stages.
+
+- Datasets are stored as Parquet or Arrow IPC (Feather) files. If pyarrow
+  isn't installed, pickles are used instead.
+- Large time-series datasets can be partitioned by date: one file per day
+  under `<name>/`. Single days can be replaced in place, and reads can be
+  restricted to a few dates.
+- Reads can project a subset of columns.
+- CSV is kept as an export format only. Partitioned datasets are exported
+  one partition at a time.
+"""
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from data_processing.timestamps import format_timestamps
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+
+# Datasets passed between stages
+GARMIN_DATASET = "processed/garmin_data"
+COMBINED_EMOTION_DATASET = "merged/combined_emotion_data"
+MERGED_DATASET = "merged/merged_data"
+LABELLED_DATASET = "merged/labelled_data"
+CLEANED_DATASET = "new/cleaned_data"
+VALENCE_DATASET = "new/final_valence"
+AROUSAL_DATASET = "new/final_arousal"
+
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "pickle": ".pkl"}
+DEFAULT_FORMAT = "parquet" if pyarrow else "pickle"
+
+
+class DatasetStore:
+    """Named datasets under a data directory, in a columnar format."""
+
+    def __init__(self, root=DATA_DIR, fmt=DEFAULT_FORMAT):
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"Unknown storage format: {fmt}")
+        if fmt != "pickle" and pyarrow is None:
+            raise ImportError(f"pyarrow is required for the {fmt} storage format")
+        self.root = root
+        self.fmt = fmt
+        self.ext = EXTENSIONS[fmt]
+
+    def path(self, name, date=None):
+        """File of an unpartitioned dataset, or of one partition of a partitioned one."""
+        if date is None:
+            return os.path.join(self.root, name + self.ext)
+        return os.path.join(self.root, name, f"date={date}{self.ext}")
+
+    def is_partitioned(self, name):
+        return os.path.isdir(os.path.join(self.root, name))
+
+    def exists(self, name):
+        return self.is_partitioned(name) or os.path.exists(self.path(name))
+
+    def partitions(self, name):
+        """Return the stored dates of a partitioned dataset in ascending order."""
+        if not self.is_partitioned(name):
+            return []
+        return sorted(entry[len("date="):-len(self.ext)] for entry in os.listdir(os.path.join(self.root, name))
+                      if entry.startswith("date=") and entry.endswith(self.ext))
+
+    def write(self, name, df, partition_on=None, replace=True):
+        """Store a DataFrame under `name`.
+
+        With `partition_on`, one file is written per date of that datetime
+        column. `replace=False` then only overwrites the dates present in
+        `df` and keeps every other stored date.
+        """
+        df = df.reset_index(drop=True)
+
+        if partition_on is None:
+            self._remove(name)
+            self._write_file(self.path(name), df)
+            return
+
+        if replace:
+            self._remove(name)
+        elif os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        for date, partition in df.groupby(df[partition_on].dt.date, sort=True):
+            self._write_file(self.path(name, date.isoformat()), partition.reset_index(drop=True))
+
+    def write_partition(self, name, date, df):
+        """Store `df` as the partition of `name` for one date, replacing only that date."""
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+        self._write_file(self.path(name, date), df.reset_index(drop=True))
+
+    def read(self, name, columns=None, dates=None):
+        """Load a dataset, optionally only some `columns` and (if partitioned) `dates`."""
+        if not self.is_partitioned(name):
+            path = self.path(name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No stored dataset {name} in {self.root}")
+            return self._read_file(path, columns)
+
+        stored = self._select(name, dates)
+        if not stored:
+            return pd.DataFrame(columns=columns)
+        if self.fmt == "pickle":
+            return pd.concat([self._read_file(self.path(name, date), columns) for date in stored], ignore_index=True)
+        # Concatenate as Arrow tables and convert to pandas once
+        tables = [self._read_table(self.path(name, date), columns) for date in stored]
+        mismatched = [date for date, table in zip(stored, tables) if not table.schema.equals(tables[0].schema)]
+        if mismatched:
+            raise ValueError(f"Partitions of {name} with a different schema from {stored[0]}: "
+                             f"{', '.join(mismatched)}. Rewrite them with the current schema.")
+        return pyarrow.concat_tables(tables).to_pandas()
+
+    def iter_partitions(self, name, columns=None, dates=None):
+        """Yield `(date, DataFrame)` for each partition, loading one at a time."""
+        for date in self._select(name, dates):
+            yield date, self._read_file(self.path(name, date), columns)
+
+    def delete_partitions(self, name, dates):
+        for date in dates:
+            path = self.path(name, date)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def export_csv(self, name, path=None, formats=None, df=None):
+        """Write a dataset as CSV, formatting the `{column: format}` datetime columns.
+
+        A partitioned dataset is appended to the file one partition at a
+        time, so it is never loaded whole.
+        """
+        path = path or os.path.join(self.root, name + ".csv")
+        if os.path.exists(path):
+            os.remove(path)
+        if df is None and self.is_partitioned(name):
+            frames = (partition for _, partition in self.iter_partitions(name))
+        else:
+            frames = [self.read(name) if df is None else df]
+        for frame in frames:
+            append_csv(path, frame, formats)
+        return path
+
+    def _select(self, name, dates):
+        stored = self.partitions(name)
+        if dates is not None:
+            wanted = set(dates)
+            stored = [date for date in stored if date in wanted]
+        return stored
+
+    def _write_file(self, path, df):
+        # Write to a temporary file first so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        if self.fmt == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        elif self.fmt == "arrow":
+            df.to_feather(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _read_file(self, path, columns=None):
+        if self.fmt == "pickle":
+            df = pd.read_pickle(path)
+            return df[columns] if columns is not None else df
+        return self._read_table(path, columns).to_pandas()
+
+    def _read_table(self, path, columns=None):
+        if self.fmt == "parquet":
+            return pyarrow.parquet.read_table(path, columns=columns)
+        return pyarrow.feather.read_table(path, columns=columns)
+
+    def _remove(self, name):
+        if self.is_partitioned(name):
+            shutil.rmtree(os.path.join(self.root, name))
+        if os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+
+
+def append_csv(path, df, formats=None):
+    """Append rows to a CSV file, writing the header if the file is new."""
+    df = format_timestamps(df, formats or {})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    header = not os.path.exists(path)
+    df.to_csv(path, mode="w" if header else "a", header=header, index=False)
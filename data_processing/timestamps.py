@@ -0,0 +1,59 @@
+"""
+Canonical timestamps for the processing pipeline.
+
+Timestamps are carried between stages as tz-aware datetime64 columns: UTC
+for Garmin sample times and Europe/Madrid for local wall-clock times, which
+is what emotion labels are recorded in. Merges therefore join on the
+underlying integer values, and timestamps are only turned into strings when
+a stage writes its CSV output.
+"""
+import numpy as np
+import pandas as pd
+
+LOCAL_TIMEZONE = "Europe/Madrid"
+
+# CSV formats of the exported files
+UTC_FORMAT = "%Y-%m-%d %H:%M:%SZ"
+LOCAL_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def from_epoch_ms(values):
+    """Epoch milliseconds (int64) to a UTC datetime64 index."""
+    return pd.to_datetime(np.asarray(values, dtype=np.int64), unit="ms", utc=True)
+
+
+def to_epoch_ms(timestamps):
+    """A tz-aware datetime Series to epoch milliseconds (int64)."""
+    return timestamps.dt.as_unit("ms").astype("int64").to_numpy()
+
+
+def to_local(timestamps):
+    """Convert a tz-aware datetime Series to local time."""
+    return timestamps.dt.tz_convert(LOCAL_TIMEZONE)
+
+
+def parse_utc(values):
+    """Parse UTC timestamp strings (e.g. `2025-03-01 10:00:00Z` or Garmin's `2025-03-01T10:00:00.0`)."""
+    return pd.to_datetime(values, utc=True)
+
+
+def localize_wall_clock(timestamps):
+    """Attach the local timezone to naive wall-clock datetimes.
+
+    Times repeated when DST ends are read as standard time and times skipped
+    when it starts are moved forward, so no label is dropped.
+    """
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        return timestamps.dt.tz_convert(LOCAL_TIMEZONE)
+    return timestamps.dt.tz_localize(LOCAL_TIMEZONE,
+                                     ambiguous=np.zeros(len(timestamps), dtype=bool),
+                                     nonexistent="shift_forward")
+
+
+def format_timestamps(df, formats):
+    """Return a copy of `df` with the given `{column: format}` datetime columns as strings."""
+    df = df.copy()
+    for column, fmt in formats.items():
+        df[column] = df[column].dt.strftime(fmt)
+    return df
@@ -10,15 +10,24 @@ from sklearn.linear_model import ElasticNet
 from sklearn.svm import SVR
 from sklearn.metrics import mean_squared_error, r2_score
 import os
+import sys
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# Add root directory to Python path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from data_processing.storage import DatasetStore, VALENCE_DATASET, AROUSAL_DATASET
+from data_processing.cleaning.imputer import MissingValueImputer, IMPUTER_PATH
+from data_processing.cleaning.emotion_pipeline import build_pipeline, save_pipeline
+
 def load_data():
     """Load the processed valence and arousal datasets."""
-    DATA_DIR = os.path.join(os.getcwd(), 'data', 'new')
+    store = DatasetStore(os.path.join(os.getcwd(), 'data'))
     
-    valence_data = pd.read_csv(os.path.join(DATA_DIR, 'final_valence.csv'))
-    arousal_data = pd.read_csv(os.path.join(DATA_DIR, 'final_arousal.csv'))
+    valence_data = store.read(VALENCE_DATASET)
+    arousal_data = store.read(AROUSAL_DATASET)
     
     return valence_data, arousal_data
 
@@ -45,8 +54,8 @@ def prepare_data(data, target_col, always_scale=False, never_scale=False):
     if always_scale:
         print("\nUsing scaled features (explicitly requested)")
         scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+        X_train_scaled = scaler.fit_transform(X_train.to_numpy())
+        X_test_scaled = scaler.transform(X_test.to_numpy())
         return X_train_scaled, X_test_scaled, y_train, y_test, scaler
     elif never_scale:
         print("\nUsing unscaled features (explicitly requested)")
@@ -54,8 +63,8 @@ def prepare_data(data, target_col, always_scale=False, never_scale=False):
     else:
         # Try both scaled and unscaled versions
         scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
+        X_train_scaled = scaler.fit_transform(X_train.to_numpy())
+        X_test_scaled = scaler.transform(X_test.to_numpy())
         
         # Use a simple model to test which version performs better
         test_model = RandomForestRegressor(n_estimators=50, random_state=42)
@@ -358,6 +367,19 @@ def main():
     feature_names = arousal_data.drop('arousal', axis=1).columns
     plot_feature_importance(best_model_a_tuned, feature_names, 'arousal', best_model_name_a)
     
+    # Bundle imputation, encoding, column selection, scaling and the model into one artifact per target.
+    # Everything is built before anything under models/trained is overwritten.
+    if os.path.exists(IMPUTER_PATH):
+        imputer = MissingValueImputer.load(IMPUTER_PATH)
+    else:
+        print(f"⚠️ No fitted imputer at {IMPUTER_PATH}, the pipelines will fill missing values from the rows they predict")
+        imputer = None
+    pipelines = {}
+    for target, data, scaler, model in [('valence', valence_data, scaler_v, best_model_v_tuned),
+                                        ('arousal', arousal_data, scaler_a, best_model_a_tuned)]:
+        columns = list(data.drop(target, axis=1).columns)
+        pipelines[target] = build_pipeline(columns, model, scaler, imputer)
+    
     # Save the best models
     models_dir = os.path.join(os.getcwd(), 'models', 'trained')
     os.makedirs(models_dir, exist_ok=True)
@@ -369,6 +391,9 @@ def main():
         joblib.dump(scaler_v, os.path.join(models_dir, 'valence_scaler.joblib'))
     if scaler_a is not None:
         joblib.dump(scaler_a, os.path.join(models_dir, 'arousal_scaler.joblib'))
+    for target, pipeline in pipelines.items():
+        path = save_pipeline(pipeline, target)
+        print(f"{target.capitalize()} pipeline saved to {path}")
     
     print("\nBest models have been saved in the models/trained directory.")
 
@@ -10,15 +10,22 @@ from sklearn.linear_model import ElasticNet
 from sklearn.svm import SVR
 from sklearn.metrics import mean_squared_error, r2_score
 import os
+import sys
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# Add root directory to Python path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from data_processing.storage import DatasetStore, VALENCE_DATASET, AROUSAL_DATASET
+
 def load_data():
     """Load the processed valence and arousal datasets and use only the most recent half of the data."""
-    DATA_DIR = os.path.join(os.getcwd(), 'data', 'new')
+    store = DatasetStore(os.path.join(os.getcwd(), 'data'))
     
-    valence_data = pd.read_csv(os.path.join(DATA_DIR, 'final_valence.csv'))
-    arousal_data = pd.read_csv(os.path.join(DATA_DIR, 'final_arousal.csv'))
+    valence_data = store.read(VALENCE_DATASET)
+    arousal_data = store.read(AROUSAL_DATASET)
     
     # Sort by timestamp and take the most recent half
     valence_data = valence_data.tail(len(valence_data) // 2)
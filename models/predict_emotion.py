@@ -8,7 +8,6 @@ import numpy as np
 from sklearn.preprocessing import StandardScaler
 import joblib
 import pytz
-import subprocess
 
 # Add root directory to Python path
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,19 +21,25 @@ debug_print("\n=== Starting Emotion Prediction ===")
 debug_print(f"Current working directory: {os.getcwd()}")
 debug_print(f"Root directory: {ROOT_DIR}")
 
-# Check if required model files exist
-required_files = [
-    os.path.join(ROOT_DIR, 'models', 'trained', 'valence_scaler.joblib'),
-    os.path.join(ROOT_DIR, 'models', 'trained', 'arousal_scaler.joblib'),
-    os.path.join(ROOT_DIR, 'models', 'trained', 'best_valence_model.joblib'),
-    os.path.join(ROOT_DIR, 'models', 'trained', 'best_arousal_model.joblib')
-]
+# Each target needs its saved pipeline, or the scaler and model of an older training run
+def legacy_files(target):
+    return [os.path.join(ROOT_DIR, 'models', 'trained', f'{target}_scaler.joblib'),
+            os.path.join(ROOT_DIR, 'models', 'trained', f'best_{target}_model.joblib')]
+
+def pipeline_file(target):
+    return os.path.join(ROOT_DIR, 'models', 'trained', f'{target}_pipeline.joblib')
 
 debug_print("\nChecking for required files:")
-for f in required_files:
-    debug_print(f"- {f}: {'✅ Found' if os.path.exists(f) else '❌ Missing'}")
+missing_files = []
+for target in ['valence', 'arousal']:
+    if os.path.exists(pipeline_file(target)):
+        debug_print(f"- {pipeline_file(target)}: ✅ Found")
+        continue
+    for f in legacy_files(target):
+        debug_print(f"- {f}: {'✅ Found' if os.path.exists(f) else '❌ Missing'}")
+        if not os.path.exists(f):
+            missing_files.append(f)
 
-missing_files = [f for f in required_files if not os.path.exists(f)]
 if missing_files:
     debug_print("\n❌ Error: Missing required model files:")
     for f in missing_files:
@@ -47,9 +52,15 @@ debug_print("✅ All required model files found")
 
 try:
     from data_processing.retrieval.last_x_days import fetch_garmin_health_data
-    from data_processing.conversion.json_to_csv import process_garmin_data, create_dataframe
-    from data_processing.cleaning.clean_data import handle_missing_values
-    from data_processing.cleaning.process_features import add_lag_features, encode_categorical_variables
+    from data_processing.retrieval.fetch_plan import build_fetch_plan, unplanned_columns
+    from data_processing.retrieval.tail import TailReader
+    from api.garmin_login import get_garmin_client
+    from data_processing.conversion.json_to_csv import convert_incremental
+    from data_processing.cleaning.imputer import MissingValueImputer, IMPUTER_PATH
+    from data_processing.cleaning.process_features import append_live_features, model_features
+    from data_processing.cleaning.emotion_pipeline import TARGETS, build_pipeline, load_pipeline
+    from data_processing.feature_store import FeatureStore, DEFAULT_USER
+    from data_processing.conversion.resample import GRID_MINUTES
     debug_print("✅ All required imports loaded successfully")
 except ImportError as e:
     debug_print(f"\n❌ Error importing required modules: {str(e)}")
@@ -57,12 +68,30 @@ except ImportError as e:
     print(json.dumps({"error": f"Error importing required modules: {str(e)}"}))
     sys.exit(1)
 
-def load_garmin_data(garmin_file):
-    """Load Garmin health data from JSON file."""
-    with open(garmin_file, "r") as f:
-        garmin_data = json.load(f)
-    debug_print("✅ Loaded Garmin health data")
-    return garmin_data
+def load_imputer():
+    """Load the imputer fitted by clean_data, or None to fill from the rows themselves."""
+    if not os.path.exists(IMPUTER_PATH):
+        debug_print(f"⚠️ No fitted imputer at {IMPUTER_PATH}, filling missing values from the current rows")
+        return None
+    return MissingValueImputer.load(IMPUTER_PATH)
+
+def load_pipelines():
+    """Load the pipeline of each target.
+    
+    Models saved before pipelines were are wrapped in one from their scaler
+    and model files, selecting the columns the scaler was fitted on. Without
+    a saved imputer, missing values are filled from the rows being predicted.
+    """
+    pipelines = {}
+    for target in TARGETS:
+        if os.path.exists(pipeline_file(target)):
+            pipelines[target] = load_pipeline(target)
+            continue
+        debug_print(f"⚠️ No {target} pipeline, building one from the saved scaler and model")
+        scaler, model = (joblib.load(f) for f in legacy_files(target))
+        columns = list(getattr(scaler, 'feature_names_in_', model_features(target)))
+        pipelines[target] = build_pipeline(columns, model, scaler, load_imputer())
+    return pipelines
 
 def find_closest_data_point(df, target_dt):
     """Find the closest data point to the target timestamp."""
@@ -106,102 +135,74 @@ def fetch_and_process_data(target_timestamp):
     debug_print(f"\n1. Input timestamp (UTC): {target_timestamp}")
     debug_print(f"2. Converted to Madrid time: {target_dt.strftime('%Y-%m-%d %H:%M:%S %Z')}")
     
-    # Calculate the two previous timestamps (4 minutes back)
-    prev_dt_1 = target_dt - timedelta(minutes=2)  # 2 minutes before
-    prev_dt_2 = target_dt - timedelta(minutes=4)  # 4 minutes before
-    
-    debug_print(f"\n3. Previous timestamps:")
-    debug_print(f"   - 2 minutes before: {prev_dt_1.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    debug_print(f"   - 4 minutes before: {prev_dt_2.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    
-    # Get all dates we need to fetch
-    dates_to_fetch = set([
-        target_dt.strftime('%Y-%m-%d'),
-        prev_dt_1.strftime('%Y-%m-%d'),
-        prev_dt_2.strftime('%Y-%m-%d')
-    ])
+    # Work out which dates and Garmin endpoints the models actually need
+    plan = build_fetch_plan(target_dt)
+    debug_print(f"\n3. Fetching Garmin data for dates: {', '.join(plan)}")
+    debug_print(f"   Endpoints: {', '.join(next(iter(plan.values())))}")
+    
+    # Today's data is tailed: only endpoints past their refresh interval are polled
+    # and only samples newer than the last cursor are appended to the raw store
+    today = datetime.now().strftime('%Y-%m-%d')
+    remaining_plan = {date: endpoints for date, endpoints in plan.items() if date != today}
+    if today in plan:
+        debug_print(f"\n4. Tailing today's Garmin data ({today})")
+        new_samples = TailReader(get_garmin_client()).poll(plan[today])
+        debug_print(f"   New samples: {new_samples if new_samples else 'none, all metrics fresh'}")
+    
+    # Fetch any earlier dates, reusing this process's Garmin session
+    if remaining_plan:
+        debug_print(f"\n5. Fetching planned Garmin data for {', '.join(remaining_plan)}")
+        fetch_garmin_health_data(plan=remaining_plan)
+    debug_print("✅ Garmin data fetched successfully")
     
-    debug_print(f"\n4. Fetching Garmin data for dates: {', '.join(dates_to_fetch)}")
+    # Convert only the planned days whose raw data changed (normally just today)
+    debug_print("\n6. Converting new Garmin data")
+    converted = convert_incremental(dates=list(plan))
+    debug_print(f"✅ Converted: {', '.join(converted) if converted else 'nothing, all days up to date'}")
+    
+    # Stream the new slots of the planned days through the lag and rolling buffers, then look the target up
+    debug_print("\n7. Appending new slots to the feature store")
+    feature_store = FeatureStore()
+    appended = append_live_features(feature_store, dates=list(plan))
+    debug_print(f"✅ Appended: {appended if appended else 'nothing, all features up to date'}")
+    df = feature_store.range(DEFAULT_USER, target_dt - timedelta(minutes=GRID_MINUTES), target_dt + timedelta(minutes=GRID_MINUTES))
+    if df.empty:
+        debug_print("❌ No stored features around the target timestamp")
+        return None
     
-    # Fetch Garmin data for each date
-    garmin_script = os.path.join(ROOT_DIR, 'data_processing/retrieval/last_x_days.py')
-    for date in dates_to_fetch:
-        debug_print(f"\n5. Running Garmin script for {date}")
-        subprocess.run(['python', garmin_script, '--target_date', date], check=True)
-    debug_print("✅ Garmin data fetched successfully")
+    # Metrics the models don't use were not fetched, so leave them out of cleaning
+    df = df.drop(columns=unplanned_columns(plan), errors='ignore')
     
-    # Convert to CSV
-    json_to_csv_script = os.path.join(ROOT_DIR, 'data_processing/conversion/json_to_csv.py')
-    debug_print("\n6. Converting Garmin data to CSV")
-    subprocess.run(['python', json_to_csv_script], check=True)
-    debug_print("✅ Garmin data converted to CSV")
-    
-    # Load and process the data
-    garmin_file = os.path.join(ROOT_DIR, 'data/raw/garmin_health_data.json')
-    debug_print(f"\n7. Loading Garmin data from: {garmin_file}")
-    garmin_data = load_garmin_data(garmin_file)
-    processed_data = process_garmin_data(garmin_data)
-    df = create_dataframe(processed_data)
-    
-    # Convert timestamps to Madrid timezone for comparison
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    if df['timestamp'].dt.tz is None:
-        df['timestamp'] = df['timestamp'].dt.tz_localize('UTC')
+    # Compare in Madrid time; timestamps are already tz-aware UTC datetimes
     df['timestamp'] = df['timestamp'].dt.tz_convert(madrid_tz)
     
     debug_print("\n8. Available timestamps in data:")
     debug_print(df['timestamp'].head())
     
-    # Find the closest timestamps for all three points
-    debug_print("\n9. Finding closest data points:")
+    # Only slots with heart rate can be matched
+    df = df[~df['gap'].astype(bool)].reset_index(drop=True)
+    
+    # Find the closest timestamp to the target
+    debug_print("\n9. Finding closest data point:")
     target_idx = find_closest_data_point(df, target_dt)
-    prev_1_idx = find_closest_data_point(df, prev_dt_1)
-    prev_2_idx = find_closest_data_point(df, prev_dt_2)
     
-    if None in [target_idx, prev_1_idx, prev_2_idx]:
-        debug_print("❌ Could not find all required timestamps in Garmin data")
+    if target_idx is None:
+        debug_print("❌ Could not find the target timestamp in Garmin data")
         return None
     
-    # Get all three rows
-    rows = df.iloc[[prev_2_idx, prev_1_idx, target_idx]]
-    debug_print("\n10. Found matching timestamps with data:")
-    for i, (idx, row) in enumerate(rows.iterrows()):
-        debug_print(f"\n   Point {i+1}: {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S %Z')}")
-        debug_print("   Raw values:")
-        for col in row.index:
-            if col != 'timestamp':
-                debug_print(f"      {col}: {row[col]}")
-    
-    # Process the data through the feature engineering pipeline
-    debug_print("\n11. Processing features...")
+    rows = df.iloc[[target_idx]]
+    debug_print(f"\n10. Found matching timestamp with data: {rows['timestamp'].iloc[0].strftime('%Y-%m-%d %H:%M:%S %Z')}")
+    for col in rows.columns:
+        if col != 'timestamp':
+            debug_print(f"      {col}: {rows[col].iloc[0]}")
     
-    # 1. Handle missing values
-    debug_print("   1.1 Handling missing values...")
-    rows = handle_missing_values(rows)
-    
-    # 2. Add lag features
-    debug_print("   1.2 Adding lag features...")
-    rows = add_lag_features(rows, rows.set_index('timestamp'))
-    
-    # 3. Encode categorical variables
-    debug_print("   1.3 Encoding categorical variables...")
-    rows = encode_categorical_variables(rows)
-    
-    debug_print("\n12. Final processed features:")
-    for i, (idx, row) in enumerate(rows.iterrows()):
-        debug_print(f"\n   Point {i+1}: {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S %Z')}")
-        debug_print("   Processed values:")
-        for col in row.index:
-            if col != 'timestamp':
-                debug_print(f"      {col}: {row[col]}")
-    
-    debug_print("✅ Feature processing complete")
-    return rows.iloc[-1]  # Return only the target row
+    debug_print("✅ Lag and rolling-window features loaded from the feature store")
+    return rows
 
 def round_timestamp(timestamp):
-    """Round timestamp down to the nearest even minute."""
+    """Round timestamp down to the start of its grid slot (the nearest even minute)."""
     dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-    rounded_minute = (dt.minute // 2) * 2
+    rounded_minute = (dt.minute // GRID_MINUTES) * GRID_MINUTES
     rounded_dt = dt.replace(minute=rounded_minute, second=0, microsecond=0)
     return rounded_dt.isoformat().replace('+00:00', 'Z')
 
@@ -239,79 +240,18 @@ def find_matching_timestamp(df, target_timestamp):
     debug_print("✅ Found exact timestamp match")
     return matching_row.iloc[0]
 
-def prepare_features(data):
-    """Prepare features for prediction."""
-    debug_print("\n=== Preparing Features ===")
-    debug_print("1. Selecting features...")
-    
-    # Define features for each model based on the final CSV files
-    valence_features = [
-        'heart_rate', 'respiration', 'body_battery', 'sleep_score', 
-        'hr_change_now', 'time_Morning', 'time_Evening', 'time_Night'
-    ]
-    
-    arousal_features = [
-        'heart_rate', 'respiration', 'spo2', 'hrv_avg', 
-        'hr_change_now', 'hr_change_2min', 'time_Morning', 'time_Afternoon'
-    ]
-    
-    debug_print(f"Valence features: {valence_features}")
-    debug_print(f"Arousal features: {arousal_features}")
-    
-    # Convert Series to DataFrame with a single row
-    X_valence = pd.DataFrame([data[valence_features]])
-    X_arousal = pd.DataFrame([data[arousal_features]])
-    
-    debug_print("\n2. Checking feature shapes...")
-    debug_print(f"Valence features shape: {X_valence.shape}")
-    debug_print(f"Arousal features shape: {X_arousal.shape}")
-    
-    debug_print("\n3. Checking feature values...")
-    debug_print("Valence features:")
-    debug_print(X_valence)
-    debug_print("\nArousal features:")
-    debug_print(X_arousal)
-    
-    debug_print("\n4. Checking for missing values...")
-    debug_print("Valence features missing values:")
-    debug_print(X_valence.isnull().sum())
-    debug_print("\nArousal features missing values:")
-    debug_print(X_arousal.isnull().sum())
-    
-    debug_print("\n5. Filling missing values...")
-    # Fill missing values with 0
-    X_valence = X_valence.fillna(0)
-    X_arousal = X_arousal.fillna(0)
-    
-    # Convert all columns to float
-    X_valence = X_valence.astype(float)
-    X_arousal = X_arousal.astype(float)
-    
-    debug_print("✅ Features prepared")
-    return X_valence, X_arousal
-
-def predict_emotion(X_valence, X_arousal):
-    """Predict valence and arousal using the trained models."""
+def predict_emotion(rows):
+    """Predict valence and arousal of raw feature-store rows with the saved pipelines."""
     debug_print("\n=== Making Predictions ===")
-    debug_print("1. Loading models and scalers...")
+    debug_print("1. Loading pipelines...")
     try:
-        # Load the scalers and models using absolute paths
-        valence_scaler = joblib.load(os.path.join(ROOT_DIR, 'models', 'trained', 'valence_scaler.joblib'))
-        arousal_scaler = joblib.load(os.path.join(ROOT_DIR, 'models', 'trained', 'arousal_scaler.joblib'))
-        valence_model = joblib.load(os.path.join(ROOT_DIR, 'models', 'trained', 'best_valence_model.joblib'))
-        arousal_model = joblib.load(os.path.join(ROOT_DIR, 'models', 'trained', 'best_arousal_model.joblib'))
-        debug_print("✅ Models and scalers loaded")
+        pipelines = load_pipelines()
+        debug_print("✅ Pipelines loaded")
         
-        debug_print("\n2. Scaling features...")
-        # Scale both valence and arousal features
-        X_valence_scaled = valence_scaler.transform(X_valence)
-        X_arousal_scaled = arousal_scaler.transform(X_arousal)
-        debug_print("✅ Features scaled")
-        
-        debug_print("\n3. Making predictions...")
-        # Make predictions
-        valence = valence_model.predict(X_valence_scaled)[0]
-        arousal = arousal_model.predict(X_arousal_scaled)[0]
+        debug_print("\n2. Making predictions...")
+        # Each pipeline imputes, encodes, selects and scales its own features
+        valence = pipelines['valence'].predict(rows)[0]
+        arousal = pipelines['arousal'].predict(rows)[0]
         debug_print(f"Valence prediction: {valence}")
         debug_print(f"Arousal prediction: {arousal}")
         debug_print("✅ Predictions made")
@@ -354,23 +294,14 @@ def main():
     debug_print(f"\nReceived timestamp: {args.timestamp}")
     
     try:
-        # Fetch and process data
-        data_point = fetch_and_process_data(args.timestamp)
-        if data_point is None:
+        # Fetch the target row and its stored features
+        rows = fetch_and_process_data(args.timestamp)
+        if rows is None:
             print(json.dumps({"error": "No matching data point found"}))
             return
         
-        # Print all available features and their values
-        debug_print("\n=== Available Features and Values ===")
-        for col in data_point.index:
-            if col != 'timestamp':
-                debug_print(f"{col}: {data_point[col]}")
-        
-        # Prepare features
-        X_valence, X_arousal = prepare_features(data_point)
-        
         # Make predictions
-        valence, arousal = predict_emotion(X_valence, X_arousal)
+        valence, arousal = predict_emotion(rows)
         
         # Determine emotion
         emotion = determine_emotion(valence, arousal)
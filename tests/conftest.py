@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Add root directory to Python path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
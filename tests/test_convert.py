@@ -0,0 +1,28 @@
+from data_processing.conversion.json_to_csv import convert_incremental, load_manifest, manifest_path
+from data_processing.retrieval.raw_store import RawStore, ENDPOINT_FIELDS
+from data_processing.storage import DatasetStore, GARMIN_DATASET
+
+DATES = ["2025-03-01", "2025-03-02", "2025-03-03"]
+
+
+def raw_store_with_days(root):
+    store = RawStore(root)
+    for i, date in enumerate(DATES):
+        start = 1740787200000 + i * 86400000
+        heart_rate = [[start + minute * 60000, 60 + minute % 5] for minute in range(0, 60, 2)]
+        store.write_day(date, {"heart_rate": heart_rate, "sleep_score": 80}, list(ENDPOINT_FIELDS))
+    return store
+
+
+def test_forcing_some_dates_keeps_the_other_hashes(tmp_path):
+    raw_store = raw_store_with_days(str(tmp_path / "garmin"))
+    data_store = DatasetStore(str(tmp_path / "data"))
+    assert convert_incremental(raw_store, data_store) == DATES
+    manifest = load_manifest(manifest_path(data_store))
+
+    assert convert_incremental(raw_store, data_store, dates=[DATES[1]], force=True) == [DATES[1]]
+
+    # The other days are still recorded, so the next run has nothing to convert
+    assert load_manifest(manifest_path(data_store)) == manifest
+    assert data_store.partitions(GARMIN_DATASET) == DATES
+    assert convert_incremental(raw_store, data_store) == []
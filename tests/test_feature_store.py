@@ -0,0 +1,154 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from data_processing.cleaning.process_features import (add_lag_features, add_rolling_features, add_stored_features,
+                                                       append_live_features, update_feature_store)
+from data_processing.conversion.json_to_csv import append_garmin_days
+from data_processing.feature_store import FeatureStore, DEFAULT_USER
+from data_processing.storage import DatasetStore, GARMIN_DATASET
+
+MINUTE_MS = 60 * 1000
+START = 1740787200000  # 2025-03-01 00:00 UTC
+
+
+def raw_day(date, start_hour, hours, seed):
+    """Heart rate every 2 minutes with random gaps, stress every 3 and body battery every 5 minutes."""
+    rng = np.random.default_rng(seed)
+    start = int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    start += start_hour * 60 * MINUTE_MS
+    minutes = np.arange(0, hours * 60)
+
+    def series(every, low, high, missing=0.0):
+        return [[start + int(m) * MINUTE_MS, float(rng.integers(low, high))]
+                for m in minutes[::every] if rng.random() >= missing]
+
+    return date, {
+        "heart_rate": series(2, 55, 110, missing=0.2),
+        "stress": {"stressValuesArray": series(3, 0, 100)},
+        "body_battery": [{"bodyBatteryValuesArray": series(5, 20, 90)}],
+        "sleep_score": 80,
+    }
+
+
+def truncated(day, end_hour):
+    """The raw day as it was at `end_hour` UTC, before the later samples arrived."""
+    date, health = day
+    end = int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000) + end_hour * 60 * MINUTE_MS
+    cut = lambda values: [sample for sample in values if sample[0] < end]
+    return date, {
+        "heart_rate": cut(health["heart_rate"]),
+        "stress": {"stressValuesArray": cut(health["stress"]["stressValuesArray"])},
+        "body_battery": [{"bodyBatteryValuesArray": cut(health["body_battery"][0]["bodyBatteryValuesArray"])}],
+        "sleep_score": health["sleep_score"],
+    }
+
+
+def stored_rows(feature_store):
+    return feature_store.range(DEFAULT_USER, 0, 2 ** 62)
+
+
+def test_live_slots_match_the_batch_features(tmp_path):
+    days = [raw_day("2025-03-01", 22, 2, seed=0), raw_day("2025-03-02", 0, 3, seed=1)]
+
+    # Batch: every day computed at once
+    batch_data = DatasetStore(str(tmp_path / "batch"))
+    list(append_garmin_days(iter(days), batch_data))
+    batch = FeatureStore(str(tmp_path / "batch.sqlite"))
+    update_feature_store(batch, batch_data)
+
+    # Live: the second day arrives in two parts and only its new slots are appended
+    live_data = DatasetStore(str(tmp_path / "live"))
+    live = FeatureStore(str(tmp_path / "live.sqlite"))
+    list(append_garmin_days(iter([days[0], truncated(days[1], 1)]), live_data))
+    append_live_features(live, live_data)
+    slots_before = len(stored_rows(live))
+    list(append_garmin_days(iter([days[1]]), live_data))
+    written = append_live_features(live, live_data, dates=["2025-03-02"])
+
+    # The newest stored slot is recomputed along with the new ones
+    assert written == len(stored_rows(live)) - slots_before + 1
+    pd.testing.assert_frame_equal(stored_rows(live), stored_rows(batch))
+
+
+def test_stored_features_match_the_features_computed_from_processed_data(tmp_path):
+    data_store = DatasetStore(str(tmp_path))
+    list(append_garmin_days(iter([raw_day("2025-03-01", 22, 2, seed=0), raw_day("2025-03-02", 0, 3, seed=1)]), data_store))
+    feature_store = FeatureStore(str(tmp_path / "features.sqlite"))
+    update_feature_store(feature_store, data_store)
+
+    garmin_data = data_store.read(GARMIN_DATASET).set_index('timestamp')
+    cleaned_data = garmin_data[~garmin_data['gap']].reset_index()[['timestamp', 'heart_rate']].iloc[::3]
+
+    stored = add_stored_features(cleaned_data, feature_store, rolling=True)
+    computed = add_rolling_features(add_lag_features(cleaned_data, garmin_data), garmin_data)
+
+    pd.testing.assert_frame_equal(stored, computed[stored.columns])
+
+
+def slot_rows(start, n, heart_rate=70.0):
+    """`n` consecutive grid slots from `start` (epoch ms) with one feature."""
+    return pd.DataFrame({"timestamp": pd.to_datetime(start + np.arange(n) * 2 * MINUTE_MS, unit="ms", utc=True),
+                         "heart_rate": heart_rate + np.arange(n), "hr_1": np.nan})
+
+
+def test_put_and_lookup(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / "features.sqlite"))
+    feature_store.put(DEFAULT_USER, "2025-03-01", slot_rows(START, 5))
+
+    # Timestamps are looked up by their grid slot; slots not stored are missing
+    timestamps = pd.to_datetime([START + 2 * 2 * MINUTE_MS + 30000, START - 2 * MINUTE_MS], unit="ms", utc=True)
+    rows = feature_store.lookup(DEFAULT_USER, timestamps)
+
+    assert rows["heart_rate"].tolist()[0] == 72.0
+    assert np.isnan(rows["heart_rate"].iloc[1])
+    assert np.isnan(rows["hr_1"]).all()
+    assert feature_store.get(DEFAULT_USER, START + 4 * 2 * MINUTE_MS)["heart_rate"] == 74.0
+    assert feature_store.get("someone else", START) is None
+    assert feature_store.last_slot(DEFAULT_USER, "2025-03-01") == START + 4 * 2 * MINUTE_MS
+
+
+def test_reads_that_fit_in_the_cache_are_served_from_it(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / "features.sqlite"), cache_size=16)
+    feature_store.put(DEFAULT_USER, "2025-03-01", slot_rows(START, 10))
+    first = feature_store.range(DEFAULT_USER, START, START + 9 * 2 * MINUTE_MS)
+
+    # Rows deleted behind the store's back are still served from the cache
+    with feature_store.connection:
+        feature_store.connection.execute("DELETE FROM features")
+    pd.testing.assert_frame_equal(feature_store.range(DEFAULT_USER, START, START + 9 * 2 * MINUTE_MS), first)
+    assert feature_store.lookup(DEFAULT_USER, first["timestamp"])["heart_rate"].tolist() == first["heart_rate"].tolist()
+    assert feature_store.get(DEFAULT_USER, START)["heart_rate"] == 70.0
+
+    # A range wider than the cache goes to the database
+    assert feature_store.range(DEFAULT_USER, START, START + 99 * 2 * MINUTE_MS).empty
+
+
+def test_put_replaces_cached_rows(tmp_path):
+    feature_store = FeatureStore(str(tmp_path / "features.sqlite"))
+    feature_store.put(DEFAULT_USER, "2025-03-01", slot_rows(START, 2))
+    assert len(feature_store.range(DEFAULT_USER, START, START + 3 * 2 * MINUTE_MS)) == 2
+
+    # Slots cached as empty, and cached rows, are replaced by a later put
+    feature_store.put(DEFAULT_USER, "2025-03-01", slot_rows(START, 4, heart_rate=90.0))
+
+    rows = feature_store.range(DEFAULT_USER, START, START + 3 * 2 * MINUTE_MS)
+    assert rows["heart_rate"].tolist() == [90.0, 91.0, 92.0, 93.0]
+
+
+def test_schema_version_change_drops_stored_rows(tmp_path):
+    path = str(tmp_path / "features.sqlite")
+    feature_store = FeatureStore(path, version=1)
+    feature_store.put(DEFAULT_USER, "2025-03-01", slot_rows(START, 3))
+    feature_store.set_source(DEFAULT_USER, "2025-03-01", "abc")
+    feature_store.close()
+
+    # Reopening with the same version keeps everything
+    feature_store = FeatureStore(path, version=1)
+    assert len(feature_store.range(DEFAULT_USER, START, START + 2 * 2 * MINUTE_MS)) == 3
+    feature_store.close()
+
+    feature_store = FeatureStore(path, version=2)
+    assert feature_store.range(DEFAULT_USER, START, START + 2 * 2 * MINUTE_MS).empty
+    assert feature_store.sources(DEFAULT_USER) == {}
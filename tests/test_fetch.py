@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from api.garmin_replay import FixtureGarmin
+from data_processing.retrieval.last_x_days import fetch_garmin_health_data
+from data_processing.retrieval.raw_store import RawStore
+from data_processing.retrieval.scheduler import DeadLetters
+
+
+class FailingGarmin(FixtureGarmin):
+    """Fixture client whose calls for some dates fail without being retried."""
+
+    def __init__(self, failing_dates):
+        super().__init__()
+        self.failing_dates = set(failing_dates)
+
+    def _call(self, endpoint, date):
+        if date in self.failing_dates:
+            raise ValueError(f"No data for {date}")
+        return super()._call(endpoint, date)
+
+
+def day(days_ago):
+    return (datetime.today() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+
+
+def test_failed_day_is_dead_lettered_and_export_still_works(tmp_path):
+    store = RawStore(str(tmp_path / "garmin"))
+
+    fetch_garmin_health_data(days=2, client=FailingGarmin([day(2)]), store=store, export=True)
+
+    assert set(DeadLetters(store.root).load()) == {day(2)}
+    assert store.dates() == [day(1), day(0)]
+    assert (tmp_path / "garmin_health_data.bin").exists()
+    assert (tmp_path / "ingest_stats.json").exists()
+
+
+def test_planned_fetch_returns_only_fetched_days_without_exporting(tmp_path):
+    store = RawStore(str(tmp_path / "garmin"))
+    fetch_garmin_health_data(days=2, client=FixtureGarmin(), store=store)
+
+    # Only today is stale, so only today is fetched and returned
+    fetched = fetch_garmin_health_data(plan={day(1): ["heart_rate"], day(0): ["heart_rate"]},
+                                       client=FixtureGarmin(), store=store)
+
+    assert list(fetched) == [day(0)]
+    assert not (tmp_path / "garmin_health_data.bin").exists()
+    assert not (tmp_path / "ingest_stats.json").exists()
+
+
+def test_next_backfill_retries_dead_lettered_day(tmp_path):
+    store = RawStore(str(tmp_path / "garmin"))
+    fetch_garmin_health_data(days=2, client=FailingGarmin([day(2)]), store=store)
+
+    # The failed day is outside this run's window, so only the dead-letter list brings it back
+    fetch_garmin_health_data(days=0, client=FixtureGarmin(), store=store)
+
+    assert DeadLetters(store.root).load() == {}
+    assert day(2) in store.dates()
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+import joblib
+import numpy as np
+from sklearn.linear_model import ElasticNet
+from sklearn.preprocessing import StandardScaler
+
+from data_processing.cleaning.emotion_pipeline import build_pipeline
+from data_processing.cleaning.process_features import model_features
+from data_processing.retrieval.fetch_plan import build_fetch_plan, load_model_features
+
+
+def test_plan_reads_features_from_saved_pipelines(tmp_path):
+    # model_selection fits the scaler on arrays, so it has no feature names
+    for target in ["valence", "arousal"]:
+        columns = model_features(target)
+        X = np.random.default_rng(0).normal(size=(20, len(columns)))
+        scaler = StandardScaler().fit(X)
+        model = ElasticNet().fit(scaler.transform(X), X[:, 0])
+        joblib.dump(build_pipeline(columns, model, scaler), tmp_path / f"{target}_pipeline.joblib")
+
+    assert load_model_features(str(tmp_path)) == {target: model_features(target) for target in ["valence", "arousal"]}
+    plan = build_fetch_plan(datetime(2025, 3, 1, 0, 2), str(tmp_path))
+    assert list(plan) == ["2025-02-28", "2025-03-01"]
+    assert "respiration" in plan["2025-03-01"] and "stress" not in plan["2025-03-01"]
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from data_processing.cleaning.clean_data import handle_missing_values
+from data_processing.cleaning.emotion_pipeline import EmotionFeatures
+from data_processing.cleaning.imputer import MissingValueImputer
+from data_processing.cleaning.process_features import model_features
+
+
+def labelled_rows():
+    """Morning and evening rows; the last of each has readings past the staleness limits."""
+    timestamps = pd.to_datetime(["2025-03-01 09:00", "2025-03-01 09:02", "2025-03-01 09:30",
+                                 "2025-03-01 19:00", "2025-03-01 19:02", "2025-03-01 19:30"]).tz_localize("Europe/Madrid")
+    return pd.DataFrame({
+        "timestamp": timestamps,
+        "heart_rate": [70.0, 72.0, 74.0, 80.0, 82.0, 84.0],
+        "stress": [20.0, 30.0, np.nan, 40.0, 50.0, np.nan],
+        "respiration": [14.0, 16.0, np.nan, 18.0, 20.0, np.nan],
+        "body_battery": [80.0, 78.0, np.nan, 40.0, 38.0, np.nan],
+        "spo2": [97.0, 96.0, 95.0, 94.0, 95.0, 96.0],
+        "sleep_score": [80.0] * 6,
+        "hrv_avg": [45.0] * 6,
+        "hr_change_now": [0.0, 2.0, 2.0, 0.0, 2.0, 2.0],
+        "hr_change_2min": [0.0] * 6,
+    })
+
+
+def test_stale_readings_are_filled_by_time_of_day():
+    data = labelled_rows()
+
+    cleaned = handle_missing_values(data, MissingValueImputer().fit(data))
+
+    # No row is dropped for a stale stress, respiration or body battery reading
+    assert len(cleaned) == len(data)
+    assert cleaned["stress"].tolist()[2::3] == [25.0, 45.0]
+    assert cleaned["respiration"].tolist()[2::3] == [15.0, 19.0]
+    assert cleaned["body_battery"].tolist()[2::3] == [79.0, 39.0]
+
+
+def test_prediction_features_fill_stale_readings():
+    data = labelled_rows()
+    imputer = MissingValueImputer().fit(data)
+
+    for target in ["valence", "arousal"]:
+        features = EmotionFeatures(model_features(target), imputer).transform(data.iloc[[2, 5]])
+        assert not np.isnan(features).any()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from data_processing.cleaning.lag_features import LAGS, LagBuffer, grid_lag_features, lag_features_at
+from data_processing.conversion.resample import grid_step
+
+START = 1740787200000  # 2025-03-01 00:00 UTC, a slot start
+
+
+def heart_rate_grid(n=200, seed=0):
+    """A heart-rate grid array with random gaps."""
+    rng = np.random.default_rng(seed)
+    heart_rate = rng.normal(70, 8, n).round(1)
+    heart_rate[rng.random(n) < 0.2] = np.nan
+    return heart_rate
+
+
+def test_lag_buffer_matches_batch_features_slot_for_slot():
+    heart_rate = heart_rate_grid()
+    batch = grid_lag_features(heart_rate)
+
+    buffer = LagBuffer()
+    for i, value in enumerate(heart_rate):
+        buffer.push(START + i * grid_step(), {"heart_rate": value})
+        for name, values in buffer.features().items():
+            np.testing.assert_equal(values, batch[name][i], err_msg=f"{name} at slot {i}")
+
+
+def test_lag_buffer_reads_skipped_slots_as_gaps():
+    heart_rate = heart_rate_grid()
+    batch = grid_lag_features(heart_rate)
+
+    # Gap slots are never pushed; the buffer has to notice they were skipped
+    buffer = LagBuffer()
+    for i in np.flatnonzero(~np.isnan(heart_rate)):
+        buffer.push(START + i * grid_step() + 30000, {"heart_rate": heart_rate[i]})
+        for name, values in buffer.features().items():
+            np.testing.assert_equal(values, batch[name][i], err_msg=f"{name} at slot {i}")
+
+
+def test_lag_features_at_looks_up_grid_positions():
+    heart_rate = heart_rate_grid()
+    batch = grid_lag_features(heart_rate)
+    positions = np.array([-1, 0, 5, 17, len(heart_rate) - 1, len(heart_rate)])
+
+    features = lag_features_at(heart_rate, positions)
+
+    inside = positions[1:-1]
+    for name in list(LAGS) + ["hr_change_now", "hr_change_2min"]:
+        np.testing.assert_equal(features[name][1:-1], batch[name][inside])
+        assert np.isnan(features[name][[0, -1]]).all()
+
+
+def test_lag_buffer_rejects_samples_out_of_order():
+    buffer = LagBuffer()
+    buffer.push(START + grid_step(), {"heart_rate": 70.0})
+    with pytest.raises(ValueError):
+        buffer.push(START, {"heart_rate": 71.0})
@@ -0,0 +1,47 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processing.cleaning.clean_data import handle_missing_values
+from data_processing.cleaning.process_features import encode_categorical_variables
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+import predict_emotion  # noqa: E402
+
+
+def feature_row():
+    """One feature-store row as prediction sees it; no sleep data was synced for the night."""
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(["2025-03-01 10:02"]).tz_localize("Europe/Madrid"),
+        "heart_rate": [78.0], "stress": [35.0], "respiration": [15.0], "body_battery": [62.0],
+        "spo2": [96.0], "sleep_score": [np.nan], "hrv_avg": [np.nan], "hrv": [np.nan], "gap": [False],
+        "hr_1": [75.0], "hr_2": [74.0], "hr_change_now": [3.0], "hr_change_2min": [-1.0],
+    })
+
+
+def legacy_prediction(rows, target):
+    """The steps prediction ran before pipelines: clean, encode, select, scale, predict."""
+    scaler, model = (predict_emotion.joblib.load(f) for f in predict_emotion.legacy_files(target))
+    derived = ["hr_1", "hr_2", "hr_change_now", "hr_change_2min"]
+    data = handle_missing_values(rows.drop(columns=derived), None).assign(**rows[derived].iloc[0])
+    data = encode_categorical_variables(data)
+    X = pd.DataFrame([data.iloc[-1][list(scaler.feature_names_in_)]]).fillna(0).astype(float)
+    return model.predict(scaler.transform(X))[0]
+
+
+def test_predicts_with_only_legacy_model_and_scaler(tmp_path, monkeypatch):
+    # No saved pipelines and no saved imputer, as in the checked-in models/trained
+    monkeypatch.setattr(predict_emotion, "pipeline_file", lambda target: str(tmp_path / f"{target}_pipeline.joblib"))
+    monkeypatch.setattr(predict_emotion, "IMPUTER_PATH", str(tmp_path / "imputer.joblib"))
+    rows = feature_row()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        valence, arousal = predict_emotion.predict_emotion(rows)
+        expected = legacy_prediction(rows, "valence"), legacy_prediction(rows, "arousal")
+
+    assert (valence, arousal) == pytest.approx(expected)
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from data_processing.retrieval.raw_format import (CODEC_JSON_ZLIB, CODEC_MSGPACK_ZSTD, MAGIC, iter_frames,
+                                                  iter_raw_frames, write_frames, write_json)
+from data_processing.retrieval.raw_store import RawStore, ENDPOINT_FIELDS
+
+DAYS = [
+    ("2025-03-02", {"heart_rate": [[1740873600000, 61], [1740873720000, None]], "sleep_score": 80}),
+    ("2025-03-01", {"heart_rate": [], "hrv": {"2025-03-01T03:00:00.0": 45}, "sleep_score": None}),
+]
+
+
+@pytest.mark.parametrize("codec", [CODEC_MSGPACK_ZSTD, CODEC_JSON_ZLIB])
+def test_frames_round_trip(tmp_path, codec):
+    path = str(tmp_path / "days.bin")
+
+    write_frames(path, iter(DAYS), codec=codec)
+
+    assert list(iter_frames(path)) == DAYS
+    assert [codec for codec, _ in iter_raw_frames(path)] == [codec, codec]
+
+
+@pytest.mark.parametrize("cut", [len(MAGIC) + 3, -1])
+def test_truncated_frames_are_rejected(tmp_path, cut):
+    path = tmp_path / "days.bin"
+    write_frames(str(path), DAYS)
+    # Cut inside the first frame header, or inside the last payload
+    path.write_bytes(path.read_bytes()[:cut])
+
+    with pytest.raises(ValueError, match="Truncated"):
+        list(iter_frames(str(path)))
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "days.json"
+    path.write_text("{}")
+
+    with pytest.raises(ValueError, match="not a raw Garmin frame file"):
+        list(iter_frames(str(path)))
+
+
+def test_json_export_matches_the_store(tmp_path):
+    store = RawStore(str(tmp_path / "garmin"))
+    for date, health in DAYS:
+        store.write_day(date, health, list(ENDPOINT_FIELDS))
+
+    store.export_json(str(tmp_path / "export.json"))
+    write_json(str(tmp_path / "days.json"), iter(DAYS))
+
+    assert json.loads((tmp_path / "export.json").read_text()) == store.load()
+    assert json.loads((tmp_path / "days.json").read_text()) == dict(DAYS)
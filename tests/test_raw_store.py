@@ -0,0 +1,33 @@
+import time
+from datetime import datetime
+
+from api.garmin_replay import FixtureGarmin
+from data_processing.retrieval.raw_format import RawDay, iter_frames
+from data_processing.retrieval.raw_store import RawStore, ENDPOINT_FIELDS
+from data_processing.retrieval.tail import TailReader, CURSOR_FILE
+
+
+def test_export_skips_tail_cursors(tmp_path):
+    store = RawStore(str(tmp_path / "garmin"))
+    now = time.time()
+    today = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+
+    TailReader(FixtureGarmin(), store).poll(now=now)
+
+    assert (tmp_path / "garmin" / CURSOR_FILE).exists()
+    assert store.dates() == [today]
+    store.export(str(tmp_path / "export.bin"))
+    assert [date for date, _ in iter_frames(str(tmp_path / "export.bin"))] == [today]
+
+
+def test_read_raw_day_is_tagged_for_both_layouts(tmp_path):
+    store = RawStore(str(tmp_path / "garmin"))
+    store.write_day("2025-03-01", {"sleep_score": 80}, list(ENDPOINT_FIELDS))
+    (tmp_path / "garmin" / "2025-03-02.json").write_text('{"sleep_score": 70}')
+
+    binary, legacy = store.read_raw_day("2025-03-01"), store.read_raw_day("2025-03-02")
+
+    assert isinstance(binary, RawDay) and binary.codec is not None
+    assert isinstance(legacy, RawDay) and legacy.codec is None
+    assert binary.decode()[1]["sleep_score"] == 80
+    assert legacy.decode() == ("2025-03-02", {"sleep_score": 70})
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from data_processing.cleaning.rolling_features import RollingUpdater, feature_specs, rolling_features
+from data_processing.conversion.resample import grid_step
+
+START = 1740787200000  # 2025-03-01 00:00 UTC, a slot start
+
+
+def signal_grid(n=300, seed=0):
+    """Grid arrays of every rolling signal, with random gaps and one gap longer than any window."""
+    rng = np.random.default_rng(seed)
+    grid = {
+        "heart_rate": rng.normal(70, 8, n).round(1),
+        "stress": rng.integers(0, 100, n).astype(np.float64),
+        "body_battery": np.linspace(90, 20, n).round(),
+    }
+    for values in grid.values():
+        values[rng.random(n) < 0.25] = np.nan
+        values[120:160] = np.nan
+    return grid
+
+
+def test_updater_matches_batch_features_with_gaps():
+    grid = signal_grid()
+    batch = rolling_features(grid)
+
+    updater = RollingUpdater()
+    for i in range(len(grid["heart_rate"])):
+        updater.push(START + i * grid_step(), {signal: values[i] for signal, values in grid.items()})
+        for name, value in updater.features().items():
+            np.testing.assert_allclose(value, batch[name][i], rtol=1e-9, atol=1e-9, err_msg=f"{name} at slot {i}")
+
+
+def test_updater_counts_skipped_slots_as_missing():
+    grid = signal_grid(seed=1)
+    batch = rolling_features(grid)
+    pushed = ~np.isnan(grid["heart_rate"])
+
+    # Only slots with heart rate are pushed; the others are skipped
+    updater = RollingUpdater()
+    for i in np.flatnonzero(pushed):
+        updater.push(START + i * grid_step(), {signal: values[i] for signal, values in grid.items()})
+        for name, (signal, _, _) in feature_specs().items():
+            if signal == "heart_rate":
+                np.testing.assert_allclose(updater.features()[name], batch[name][i], rtol=1e-9, atol=1e-9,
+                                           err_msg=f"{name} at slot {i}")
+
+
+def test_updater_takes_one_sample_per_slot():
+    updater = RollingUpdater()
+    updater.push(START, {"heart_rate": 70.0})
+    with pytest.raises(ValueError):
+        updater.push(START + 1000, {"heart_rate": 71.0})
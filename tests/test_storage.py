@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processing.conversion.json_to_csv import append_garmin_days
+from data_processing.storage import DatasetStore, GARMIN_DATASET
+
+MINUTE_MS = 60 * 1000
+
+
+def heart_rate_day(date, step_minutes):
+    """One hour of heart rate sampled every `step_minutes`, with odd and even values."""
+    start = int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    values = [[start + m * MINUTE_MS, 60 + m % 7] for m in range(0, 60, step_minutes)]
+    return date, {"heart_rate": values, "sleep_score": 80}
+
+
+def test_partitions_with_whole_and_fractional_heart_rate_read_together(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    # Every 2-minute slot holds one reading (whole means) or two (fractional means)
+    days = [heart_rate_day("2025-03-01", 2), heart_rate_day("2025-03-02", 1)]
+
+    list(append_garmin_days(iter(days), store))
+
+    df = store.read(GARMIN_DATASET)
+    assert sorted(df['timestamp'].dt.date.astype(str).unique()) == ["2025-03-01", "2025-03-02"]
+    assert df['heart_rate'].dtype == np.float32
+    assert (df['heart_rate'] % 1 != 0).any()
+
+
+def test_partitions_written_with_another_schema_fail_loudly(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    timestamps = pd.to_datetime(["2025-03-01 10:00", "2025-03-02 10:00"], utc=True)
+    store.write_partition(GARMIN_DATASET, "2025-03-01",
+                          pd.DataFrame({"timestamp": timestamps[:1], "heart_rate": pd.array([70], dtype="Int16")}))
+    store.write_partition(GARMIN_DATASET, "2025-03-02",
+                          pd.DataFrame({"timestamp": timestamps[1:], "heart_rate": np.array([70.5], dtype=np.float32)}))
+
+    with pytest.raises(ValueError, match="2025-03-02"):
+        store.read(GARMIN_DATASET)